@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+
+"""
+Eltako2MQTT Benchmark
+
+Runs the bridge end to end against a simulated MiniSafe2 gateway (HTTP
+/command endpoint with GetStates/SendSC) and a minimal in-process MQTT
+broker. Gateway and broker run in a child process, so CPU time and RSS of
+this process belong to the bridge alone.
+
+Usage: python3 benchmark.py [--devices 10,100,1000] [--duration 20] [--json]
+       python3 benchmark.py --devices 200 --scene-size 50 --scene-mode group,individual
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import statistics
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+from aiohttp import web
+
+import eltako2mqtt
+
+# Device mix of the simulated installation: (type, share)
+DEVICE_MIX = (
+    ("eltako_dimmer", 0.35),
+    ("eltako_fsr14", 0.35),
+    ("eltako_blind", 0.2),
+    ("eltako_weather", 0.05),
+    ("eltako_tf_smoke", 0.05),
+)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (peak RSS if /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SimulatedGateway:
+    """Stand-in for the MiniSafe2 HTTP /command endpoint"""
+
+    def __init__(self, device_count: int, latency: float, jitter: float, change_rate: float, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.change_rate = change_rate
+        self.random = random.Random(seed)
+        self.devices: List[Dict[str, Any]] = []
+        self.by_address: Dict[str, Dict[str, Any]] = {}
+        self.get_states = 0
+        self.send_sc = 0
+        types = []
+        for device_type, share in DEVICE_MIX:
+            types += [device_type] * max(1, round(device_count * share))
+        for i in range(device_count):
+            device_type = types[i % len(types)]
+            device = {
+                "sid": f"{i + 1:04d}",
+                "data": device_type,
+                "adr": f"0x{0xFF000000 + i:08X}",
+                "state": self._initial_state(device_type),
+            }
+            self.devices.append(device)
+            self.by_address[device["adr"]] = device
+
+    def _initial_state(self, device_type: str) -> Dict[str, Any]:
+        rssi = self.random.randint(40, 95)
+        if "dimmer" in device_type:
+            return {"state": "off", "level": 0, "rssiPercentage": rssi}
+        if "blind" in device_type:
+            return {"pos": 0, "sync": True, "rv": 1.5, "rt": 1000, "rssiPercentage": rssi}
+        if "weather" in device_type:
+            return {"wind": 1.0, "rain_state": False, "temperature": 12.0, "illumination": 5000,
+                    "s1": 1.2, "s2": 1.4, "s3": 1.1, "rssiPercentage": rssi}
+        if "smoke" in device_type:
+            return {"smoke": False, "temperature": 21, "rssiPercentage": rssi}
+        return {"state": "off", "rssiPercentage": rssi}
+
+    def _mutate(self):
+        """Change a share of the devices between polls (RSSI, sensor values)"""
+        count = int(len(self.devices) * self.change_rate)
+        for device in self.random.sample(self.devices, count):
+            state = device["state"]
+            state["rssiPercentage"] = self.random.randint(40, 95)
+            if "illumination" in state:
+                state["illumination"] = self.random.randint(1000, 50000)
+                state["s1"] = round(self.random.uniform(0, 50), 3)
+
+    def _apply(self, device: Dict[str, Any], data: str):
+        state = device["state"]
+        if data.startswith("dimTo"):
+            state["level"] = int(data[5:])
+            state["state"] = "on"
+        elif data.startswith("moveTo"):
+            state["pos"] = int(data[6:])
+        elif data in ("on", "off"):
+            state["state"] = data
+        elif data == "toggle":
+            state["state"] = "off" if state.get("state") == "on" else "on"
+        elif data == "moveup":
+            state["pos"] = 0
+        elif data == "movedown":
+            state["pos"] = 100
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        function = request.query.get("XC_FNC")
+        if function == "GetStates":
+            self.get_states += 1
+            self._mutate()
+            return web.Response(text="{XC_SUC}" + json.dumps(self.devices))
+        if function == "SendSC":
+            self.send_sc += 1
+            device = self.by_address.get(request.query.get("address", ""))
+            if device is None:
+                return web.Response(text="{XC_ERR}Unknown address")
+            self._apply(device, request.query.get("data", ""))
+            return web.Response(text="{XC_SUC}")
+        return web.Response(text="{XC_ERR}Unknown function")
+
+
+class MQTTSink:
+    """Minimal MQTT 3.1.1 broker (QoS 0) that counts and routes publishes"""
+
+    def __init__(self):
+        self.clients: Dict[asyncio.StreamWriter, List[str]] = {}
+        self.publishes = 0
+        self.first_publish: Optional[float] = None
+        self.last_publish: Optional[float] = None
+        self.retained: Dict[str, bytes] = {}
+        self.listeners: List[Any] = []
+
+    @staticmethod
+    async def _read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        return header, await reader.readexactly(length)
+
+    @staticmethod
+    def _packet(header: int, body: bytes) -> bytes:
+        length = len(body)
+        encoded = bytearray()
+        while True:
+            byte = length % 128
+            length //= 128
+            encoded.append(byte | (0x80 if length else 0))
+            if not length:
+                break
+        return bytes([header]) + bytes(encoded) + body
+
+    def publish_packet(self, topic: str, payload: bytes, retain: bool = False) -> bytes:
+        topic_bytes = topic.encode()
+        return self._packet(0x30 | int(retain), struct.pack("!H", len(topic_bytes)) + topic_bytes + payload)
+
+    def route(self, topic: str, payload: bytes):
+        """Deliver a publish to all subscribed clients"""
+        packet = self.publish_packet(topic, payload)
+        for writer, filters in list(self.clients.items()):
+            if any(mqtt.topic_matches_sub(f, topic) for f in filters):
+                writer.write(packet)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients[writer] = []
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif packet_type == 3:  # PUBLISH
+                    topic_length = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + topic_length].decode()
+                    offset = 2 + topic_length + (2 if header & 0x06 else 0)
+                    payload = body[offset:]
+                    now = time.monotonic()
+                    self.publishes += 1
+                    self.first_publish = self.first_publish or now
+                    self.last_publish = now
+                    if header & 0x01:
+                        self.retained[topic] = payload
+                    for listener in self.listeners:
+                        listener(topic, payload, now)
+                    self.route(topic, payload)
+                elif packet_type == 8:  # SUBSCRIBE
+                    packet_id = body[:2]
+                    offset = 2
+                    granted = bytearray()
+                    while offset < len(body):
+                        length = struct.unpack("!H", body[offset:offset + 2])[0]
+                        self.clients[writer].append(body[offset + 2:offset + 2 + length].decode())
+                        offset += 2 + length + 1
+                        granted.append(0)
+                    writer.write(self._packet(0x90, packet_id + bytes(granted)))
+                elif packet_type == 10:  # UNSUBSCRIBE
+                    writer.write(self._packet(0xB0, body[:2]))
+                elif packet_type == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif packet_type == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+
+class CommandProbe:
+    """Sends commands through the broker and times the bridge's state publish"""
+
+    def __init__(self, sink: MQTTSink, gateway: SimulatedGateway):
+        self.sink = sink
+        self.targets = command_targets(gateway)
+        self._waiting: Dict[str, Tuple[str, float]] = {}
+        self.round_trips: List[float] = []
+        self.sent = 0
+        sink.listeners.append(self._on_publish)
+
+    def _on_publish(self, topic: str, payload: bytes, now: float):
+        parts = topic.split("/")
+        if len(parts) == 3 and parts[2] == "state":
+            waiting = self._waiting.get(parts[1])
+            if waiting and payload.decode() == waiting[0]:
+                self.round_trips.append(now - waiting[1])
+                del self._waiting[parts[1]]
+
+    def send(self, device: Dict[str, Any], command: str, expected: str):
+        self._waiting[device["sid"]] = (expected, time.monotonic())
+        self.sent += 1
+        self.sink.route(f"eltako/{device['sid']}/set", command.encode())
+
+    async def run(self, rate: float):
+        if not self.targets:
+            return
+        last: Dict[str, str] = {}
+        while True:
+            await asyncio.sleep(1 / rate)
+            device = random.choice(self.targets)
+            # Alternate per device, so every command changes the state
+            command = "off" if last.get(device["sid"]) == "on" else "on"
+            last[device["sid"]] = command
+            self.send(device, command, command)
+
+
+def command_targets(gateway: SimulatedGateway) -> List[Dict[str, Any]]:
+    """Devices with an optimistic on/off state (dimmers and switches)"""
+    return [d for d in gateway.devices if "dimmer" in d["data"] or "fsr14" in d["data"]]
+
+
+class SceneProbe:
+    """Switches a set of devices together and times until all their states are published
+
+    In `group` mode the scene is one message to eltako/group/bench/set, in
+    `individual` mode one eltako/<sid>/set message per device (as Home
+    Assistant sends scenes).
+    """
+
+    def __init__(self, sink: MQTTSink, members: List[Dict[str, Any]], mode: str):
+        self.sink = sink
+        self.members = members
+        self.mode = mode
+        self._waiting: Dict[str, str] = {}
+        self._started = 0.0
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.incomplete = 0
+        sink.listeners.append(self._on_publish)
+
+    def _on_publish(self, topic: str, payload: bytes, now: float):
+        parts = topic.split("/")
+        if len(parts) == 3 and parts[2] == "state" and self._waiting.get(parts[1]) == payload.decode():
+            del self._waiting[parts[1]]
+            if not self._waiting:
+                self.latencies.append(now - self._started)
+
+    async def run(self, interval: float):
+        command = "on"
+        while True:
+            await asyncio.sleep(interval)
+            if self._waiting:
+                self.incomplete += 1
+            self._waiting = {device["sid"]: command for device in self.members}
+            self._started = time.monotonic()
+            self.sent += 1
+            if self.mode == "group":
+                self.sink.route("eltako/group/bench/set", command.encode())
+            else:
+                for device in self.members:
+                    self.sink.route(f"eltako/{device['sid']}/set", command.encode())
+            command = "off" if command == "on" else "on"
+
+
+def simulator_main(conn, http_port: int, mqtt_port: int, args: Dict[str, Any]):
+    """Child process: run gateway and broker until asked for results"""
+
+    async def main():
+        gateway = SimulatedGateway(args["devices"], args["latency"], args["jitter"], args["change_rate"])
+        sink = MQTTSink()
+        probe = CommandProbe(sink, gateway)
+        scene = None
+        if args["scene_size"]:
+            members = command_targets(gateway)[:args["scene_size"]]
+            # Single commands leave the scene devices alone
+            probe.targets = [d for d in probe.targets if d not in members]
+            scene = SceneProbe(sink, members, args["scene_mode"])
+        app = web.Application()
+        app.router.add_get("/command", gateway.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", http_port).start()
+        server = await asyncio.start_server(sink.handle, "127.0.0.1", mqtt_port)
+        loop = asyncio.get_running_loop()
+        conn.send("ready")
+        # Start commands when the bridge signals it is running
+        await loop.run_in_executor(None, conn.recv)
+        start_publishes = sink.publishes
+        start = time.monotonic()
+        probe_task = asyncio.create_task(probe.run(args["command_rate"])) if args["command_rate"] else None
+        scene_task = asyncio.create_task(scene.run(args["scene_interval"])) if scene else None
+        await loop.run_in_executor(None, conn.recv)
+        elapsed = time.monotonic() - start
+        for task in (probe_task, scene_task):
+            if task:
+                task.cancel()
+        conn.send({
+            "publishes": sink.publishes - start_publishes,
+            "publish_rate": (sink.publishes - start_publishes) / elapsed,
+            "get_states": gateway.get_states,
+            "send_sc": gateway.send_sc,
+            "commands": probe.sent,
+            "round_trips": probe.round_trips,
+            "scenes": scene.sent if scene else 0,
+            "scenes_incomplete": scene.incomplete if scene else 0,
+            "scene_latencies": scene.latencies if scene else [],
+        })
+        # Keep serving until the bridge has disconnected
+        await loop.run_in_executor(None, conn.recv)
+        server.close()
+        await runner.cleanup()
+
+    asyncio.run(main())
+
+
+async def run_bridge(config_path: str, duration: float, warmup: float, conn) -> Dict[str, Any]:
+    bridge = eltako2mqtt.EltakoMiniSafe2Bridge(config_path)
+    cycle_times: List[float] = []
+    cycle_cpu: List[float] = []
+    poll_once = bridge._poll_once
+
+    async def timed_poll_once(gateway):
+        start = time.perf_counter()
+        # Includes the little work other tasks do while the poll awaits the gateway
+        cpu_start = time.process_time()
+        try:
+            await poll_once(gateway)
+        finally:
+            cycle_times.append(time.perf_counter() - start)
+            cycle_cpu.append(time.process_time() - cpu_start)
+
+    bridge._poll_once = timed_poll_once
+    start = time.monotonic()
+    task = asyncio.create_task(bridge.run())
+    while not bridge.running:
+        if task.done() or time.monotonic() - start > 60:
+            raise RuntimeError("Bridge did not start")
+        await asyncio.sleep(0.05)
+    startup_time = time.monotonic() - start
+    await asyncio.sleep(warmup)
+    cycle_times.clear()
+    cycle_cpu.clear()
+    conn.send("start")
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    await asyncio.sleep(duration)
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+    rss = rss_mb()
+    conn.send("stop")
+    sim_result = conn.recv()
+    bridge.running = False
+    await asyncio.wait_for(task, 30)
+    conn.send("exit")
+    return {
+        "simulator": sim_result,
+        "startup_time": startup_time,
+        "cycle_times": cycle_times,
+        "cycle_cpu": cycle_cpu,
+        "cpu_percent": 100 * cpu / wall,
+        "rss_mb": rss,
+        "statistics": bridge.get_statistics(),
+    }
+
+
+def write_config(http_port: int, mqtt_port: int, args: argparse.Namespace, extra: Dict[str, Any]) -> str:
+    config = {
+        "eltako": {"host": f"127.0.0.1:{http_port}", "password": "benchmark", "poll_interval": args.poll_interval},
+        "mqtt": {"host": "127.0.0.1", "port": mqtt_port, "client_id": "eltako2mqtt-benchmark"},
+        "logging": {"level": "WARNING"},
+        "publish": {"stats_interval": 0},
+        # Every run measures a cold start
+        "snapshot": {"enabled": False},
+    }
+    for section, values in extra.items():
+        if isinstance(values, dict):
+            config.setdefault(section, {}).update(values)
+        else:
+            config[section] = values
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        json.dump(config, f)
+    return f.name
+
+
+def benchmark(device_count: int, args: argparse.Namespace, extra: Optional[Dict[str, Any]] = None,
+              scene_mode: str = "group") -> Dict[str, Any]:
+    http_port, mqtt_port = free_port(), free_port()
+    parent, child = multiprocessing.Pipe()
+    sim_args = {
+        "devices": device_count,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "change_rate": args.change_rate,
+        "command_rate": args.command_rate,
+        "scene_size": args.scene_size,
+        "scene_mode": scene_mode,
+        "scene_interval": args.scene_interval,
+    }
+    process = multiprocessing.Process(target=simulator_main, args=(child, http_port, mqtt_port, sim_args), daemon=True)
+    process.start()
+    try:
+        if parent.recv() != "ready":
+            raise RuntimeError("Simulator failed to start")
+        config_path = write_config(http_port, mqtt_port, args, extra or {})
+        try:
+            bridge_result = asyncio.run(run_bridge(config_path, args.duration, args.warmup, parent))
+        finally:
+            os.unlink(config_path)
+        sim_result = bridge_result["simulator"]
+    finally:
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+
+    cycles = bridge_result["cycle_times"]
+    round_trips = sim_result["round_trips"]
+    scenes = sim_result["scene_latencies"]
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "devices": device_count,
+        "startup_s": round(bridge_result["startup_time"], 3),
+        "polls": len(cycles),
+        "poll_cycle_avg_ms": ms(statistics.mean(cycles)) if cycles else None,
+        "poll_cycle_p95_ms": ms(percentile(cycles, 95)),
+        "poll_cpu_ms": ms(statistics.mean(bridge_result["cycle_cpu"])) if bridge_result["cycle_cpu"] else None,
+        "publishes_per_s": round(sim_result["publish_rate"], 1),
+        "commands": sim_result["commands"],
+        "command_rtt_avg_ms": ms(statistics.mean(round_trips)) if round_trips else None,
+        "command_rtt_p95_ms": ms(percentile(round_trips, 95)),
+        "scenes": sim_result["scenes"],
+        "scenes_incomplete": sim_result["scenes_incomplete"],
+        "scene_avg_ms": ms(statistics.mean(scenes)) if scenes else None,
+        "scene_p95_ms": ms(percentile(scenes, 95)),
+        "cpu_percent": round(bridge_result["cpu_percent"], 1),
+        "rss_mb": round(bridge_result["rss_mb"], 1),
+        "statistics": bridge_result["statistics"],
+    }
+
+
+COLUMNS = (
+    ("devices", "devices"),
+    ("polls", "polls"),
+    ("poll_cycle_avg_ms", "cycle avg ms"),
+    ("poll_cycle_p95_ms", "cycle p95 ms"),
+    ("poll_cpu_ms", "cpu/poll ms"),
+    ("publishes_per_s", "pub/s"),
+    ("commands", "cmds"),
+    ("command_rtt_avg_ms", "rtt avg ms"),
+    ("command_rtt_p95_ms", "rtt p95 ms"),
+    ("cpu_percent", "cpu %"),
+    ("rss_mb", "rss MB"),
+)
+
+SCENE_COLUMNS = (
+    ("scenes", "scenes"),
+    ("scene_avg_ms", "scene avg ms"),
+    ("scene_p95_ms", "scene p95 ms"),
+)
+
+
+def print_table(results: List[Dict[str, Any]], label_keys: Tuple[str, ...] = (),
+                extra_columns: Tuple[Tuple[str, str], ...] = ()):
+    columns = tuple((key, key) for key in label_keys) + COLUMNS + extra_columns
+    widths = [max(len(title), 8) for _, title in columns]
+    print("  ".join(title.rjust(width) for (_, title), width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result.get(key)).rjust(width) for (key, _), width in zip(columns, widths)))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the Eltako2MQTT bridge against simulated gateway and broker")
+    parser.add_argument("--devices", default="10,100,1000", help="Comma separated device counts (default: 10,100,1000)")
+    parser.add_argument("--duration", type=float, default=20, help="Measurement seconds per run (default: 20)")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds before measuring (default: 3)")
+    parser.add_argument("--poll-interval", type=int, default=2, help="Bridge poll_interval (default: 2)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Gateway response latency in seconds (default: 0.05)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Gateway latency jitter in seconds (default: 0.02)")
+    parser.add_argument("--change-rate", type=float, default=0.1, help="Share of devices changing per poll (default: 0.1)")
+    parser.add_argument("--command-rate", type=float, default=2, help="Commands per second (default: 2)")
+    parser.add_argument("--mqtt-loop", default="thread",
+                        help="Comma separated MQTT loop modes to compare: thread, asyncio (default: thread)")
+    parser.add_argument("--delta", default="on",
+                        help="Comma separated delta mode settings to compare: on, off (default: on)")
+    parser.add_argument("--scene-size", type=int, default=0,
+                        help="Devices switched together per scene, 0 disables scenes (default: 0)")
+    parser.add_argument("--scene-mode", default="group",
+                        help="Comma separated scene modes to compare: group (one group topic message), "
+                             "individual (one message per device) (default: group)")
+    parser.add_argument("--scene-interval", type=float, default=10, help="Seconds between scenes (default: 10)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    modes = args.mqtt_loop.split(",")
+    deltas = args.delta.split(",")
+    scene_modes = args.scene_mode.split(",") if args.scene_size else ["group"]
+    results = []
+    for mode in modes:
+        for delta in deltas:
+            for scene_mode in scene_modes:
+                for count in args.devices.split(","):
+                    extra = {"mqtt": {"loop": mode}, "polling": {"delta": delta == "on"}}
+                    if args.scene_size:
+                        # Same member selection as the simulator's SceneProbe
+                        members = command_targets(SimulatedGateway(int(count), 0, 0, 0))[:args.scene_size]
+                        extra["groups"] = [{"name": "bench", "members": [d["sid"] for d in members]}]
+                    result = benchmark(int(count), args, extra, scene_mode)
+                    result.update(mqtt_loop=mode, delta=delta, scene_mode=scene_mode)
+                    results.append(result)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        labels = (("mqtt_loop", modes), ("delta", deltas), ("scene_mode", scene_modes))
+        print_table(results, tuple(key for key, values in labels if len(values) > 1),
+                    SCENE_COLUMNS if args.scene_size else ())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,19 +11,2481 @@ Modern MQTT callback API for improved compatibility
 
 import asyncio
 import aiohttp
+from aiohttp import web
+import atexit
+from array import array
+import bisect
+import codecs
+import copy
+import functools
+import hashlib
+import itertools
 import json
 import logging
+import logging.handlers
+import math
+import operator
+import os
+import queue
+import random
 import signal
 import sys
+import threading
 import yaml
-from typing import Dict, Any, Optional
+from collections import deque
+from contextlib import aclosing
+from enum import Enum
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable, List, AsyncIterator
 import paho.mqtt.client as mqtt
 from urllib.parse import quote_plus
+from yarl import URL
 import time
 
+try:
+    import orjson  # Optional: faster parsing of buffered GetStates responses
+except ImportError:
+    orjson = None
+
 # Placeholder logger - will be configured after loading config
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Record attributes set via log_extra(), emitted as fields in the JSON format
+LOG_FIELDS = ("gateway", "sid", "kind", "phase")
+
+
+def log_extra(sid: str, phase: str, gateway: Optional[str] = None, kind: Optional[str] = None) -> Dict[str, Any]:
+    """`extra` for log records about one device (JSON fields, per-SID debug)"""
+    return {"sid": sid, "phase": phase, "gateway": gateway, "kind": kind}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record with the device fields of log_extra()"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves the traceback to the listener's formatter
+
+    The stock prepare() folds it into the message, so the JSON format
+    could never fill its `exception` field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Rendered here so the queued record doesn't keep the frames alive
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SidDebugFilter(logging.Filter):
+    """Lets records below `level` through only for the listed SIDs (or gateway/SID)"""
+
+    def __init__(self, sids: List[str], level: int):
+        super().__init__()
+        self.sids = frozenset(str(sid) for sid in sids)
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.level:
+            return True
+        sid = getattr(record, "sid", None)
+        if sid is None:
+            return False
+        return sid in self.sids or f"{getattr(record, 'gateway', None)}/{sid}" in self.sids
+
+
+def configure_logging(level: int, logging_config: Dict[str, Any]) -> Optional[logging.handlers.QueueListener]:
+    """Set up the root logger from the `logging` section
+
+    With `queue` (default) records are handed to a listener thread, so a
+    slow stdout never blocks the event loop. Returns that listener.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        # Already configured (e.g. embedded), like logging.basicConfig()
+        root.setLevel(level)
+        return None
+    handler: logging.Handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter() if logging_config.get('format') == 'json' else logging.Formatter(LOG_FORMAT))
+    listener = None
+    if logging_config.get('queue', True):
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        listener.start()
+        handler = LogQueueHandler(log_queue)
+    debug_sids = logging_config.get('debug_sids') or []
+    if debug_sids:
+        # DEBUG for a few devices of this module only; the root logger (and
+        # so aiohttp, paho and asyncio) stays at `level`
+        handler.addFilter(SidDebugFilter(debug_sids, level))
+        logging.getLogger(__name__).setLevel(logging.DEBUG)
+    root.addHandler(handler)
+    root.setLevel(level)
+    return listener
+
+
+def encode_payload(value: Any) -> Any:
+    """Normalize a state value to the payload paho-mqtt would put on the wire"""
+    if value is None:
+        return ""
+    if isinstance(value, (str, bytes, bytearray)):
+        return value
+    return str(value)
+
+
+GETSTATES_PREFIX = "{XC_SUC}"
+BRIDGE_AVAILABILITY_TOPIC = "eltako/bridge/availability"
+PROFILE_TOPIC = "eltako/bridge/profile"
+HISTORY_REQUEST_TOPIC = "eltako/bridge/history/get"
+HISTORY_RESPONSE_TOPIC = "eltako/bridge/history"
+GROUP_TOPIC_PREFIX = "eltako/group/"
+# Topic levels below eltako/ that can't be gateway names
+RESERVED_GATEWAY_NAMES = ("bridge", "group")
+
+
+class GatewayError(Exception):
+    """Unexpected response from the MiniSafe2 gateway"""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter: base * 2^attempt (capped), scaled by 0.5-1.0"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class GetStatesParser:
+    """Incremental parser for GetStates responses
+    
+    The body is fed in chunks and complete device records are returned as
+    soon as they have arrived. The {XC_SUC} prefix is skipped by index and
+    each record is decoded directly from the text buffer with the C JSON
+    scanner, so the complete body is never held in memory. Both a top-level
+    device list and {"devices": [...]} are accepted.
+    """
+
+    _decoder = json.JSONDecoder()
+    _WHITESPACE = ' \t\r\n,'
+    PREFIX, HEAD, ARRAY, DONE = range(4)
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._stage = self.PREFIX
+        self.bytes = 0
+        self.records = 0
+        self.peak_buffer = 0
+        self.parse_time = 0.0
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Dict[str, Any]]:
+        """Add a chunk of the body, return the records completed by it"""
+        start = time.perf_counter()
+        self.bytes += len(chunk)
+        text = self._utf8.decode(chunk, final)
+        # Drop the consumed part; only an incomplete record is carried over
+        self._buf = self._buf[self._pos:] + text if self._pos else self._buf + text
+        self._pos = 0
+        self.peak_buffer = max(self.peak_buffer, len(self._buf))
+        try:
+            return self._parse(final)
+        finally:
+            self.parse_time += time.perf_counter() - start
+
+    def _parse(self, final: bool) -> List[Dict[str, Any]]:
+        records = []
+        buf = self._buf
+        pos = self._pos
+        end = len(buf)
+        if self._stage == self.PREFIX:
+            if end < len(GETSTATES_PREFIX) and not final:
+                return records
+            if not buf.startswith(GETSTATES_PREFIX):
+                raise GatewayError(f"Unexpected response: {buf[:200]}")
+            pos = len(GETSTATES_PREFIX)
+            self._stage = self.HEAD
+        if self._stage == self.HEAD:
+            start = buf.find('[', pos)
+            if start < 0:
+                if final:
+                    raise GatewayError(f"No device list in response: {buf[pos:pos + 200]}")
+                self._pos = end
+                return records
+            pos = start + 1
+            self._stage = self.ARRAY
+        while self._stage == self.ARRAY:
+            while pos < end and buf[pos] in self._WHITESPACE:
+                pos += 1
+            if pos >= end:
+                break
+            if buf[pos] == ']':
+                self._stage = self.DONE
+                break
+            try:
+                record, pos_end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                # Record not complete yet
+                break
+            records.append(record)
+            pos = pos_end
+        self.records += len(records)
+        self._pos = pos
+        if final and self._stage != self.DONE:
+            raise GatewayError("Truncated GetStates response")
+        return records
+
+
+def parse_getstates_body(body: bytes) -> List[Dict[str, Any]]:
+    """Parse a complete GetStates body, using orjson when it is installed"""
+    prefix = GETSTATES_PREFIX.encode()
+    if not body.startswith(prefix):
+        raise GatewayError(f"Unexpected response: {body[:200].decode(errors='replace')}")
+    if orjson is not None:
+        data = orjson.loads(memoryview(body)[len(prefix):])
+    else:
+        data, _ = GetStatesParser._decoder.raw_decode(body.decode(), len(prefix))
+    if isinstance(data, dict):
+        data = data.get("devices", [])
+    return data
+
+
+class ParseStats:
+    """Body size, buffer peak and parse time of GetStates responses"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.responses = 0
+        self.last_bytes = 0
+        self.last_records = 0
+        self.last_peak_buffer = 0
+        self.max_peak_buffer = 0
+        self.last_parse_time = 0.0
+        self.total_parse_time = 0.0
+
+    def record(self, body_bytes: int, records: int, peak_buffer: int, parse_time: float):
+        self.responses += 1
+        self.last_bytes = body_bytes
+        self.last_records = records
+        self.last_peak_buffer = peak_buffer
+        self.max_peak_buffer = max(self.max_peak_buffer, peak_buffer)
+        self.last_parse_time = parse_time
+        self.total_parse_time += parse_time
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "backend": "orjson" if self.mode == "buffered" and orjson is not None else "json",
+            "bytes_last": self.last_bytes,
+            "records_last": self.last_records,
+            "peak_buffer_last": self.last_peak_buffer,
+            "peak_buffer_max": self.max_peak_buffer,
+            "parse_time_last": round(self.last_parse_time, 4),
+            "parse_time_avg": round(self.total_parse_time / self.responses, 4) if self.responses else None,
+        }
+
+
+class Histogram:
+    """Latency histogram with fixed upper bucket bounds in seconds"""
+
+    DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+    LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def stats(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 3) if self.count else None,
+            "buckets": buckets,
+        }
+
+
+class PhaseTimer:
+    """Wall time per phase of one poll cycle or command
+
+    `lap(phase)` attributes the time since the previous lap to `phase`, so
+    interleaved phases (e.g. per GetStates record) add up to the total.
+    """
+
+    __slots__ = ("started", "phases", "_mark")
+
+    def __init__(self):
+        self.started = self._mark = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._mark
+        self._mark = now
+
+    def move(self, source: str, target: str, seconds: float):
+        """Re-attribute time measured elsewhere (e.g. parse time inside the fetch phase)"""
+        seconds = min(seconds, self.phases.get(source, 0.0))
+        if seconds > 0:
+            self.phases[source] -= seconds
+            self.phases[target] = self.phases.get(target, 0.0) + seconds
+
+    @property
+    def total(self) -> float:
+        return self._mark - self.started
+
+    def breakdown(self) -> str:
+        return " ".join(f"{phase}={seconds:.3f}s" for phase, seconds in
+                        sorted(self.phases.items(), key=lambda item: -item[1]))
+
+
+class MetricsWriter:
+    """Renders metrics in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> str:
+        if not labels:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in labels.values())
+        return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels.keys(), escaped)) + "}"
+
+    def metric(self, name: str, metric_type: str, help_text: str, samples: List[Tuple[Dict[str, Any], Any]]):
+        """Add a counter or gauge with (labels, value) samples"""
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            if value is not None:
+                self._lines.append(f"{name}{self._labels(labels)} {value}")
+
+    def histogram(self, name: str, help_text: str, samples: List[Tuple[Dict[str, Any], 'Histogram']]):
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in samples:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                self._lines.append(f"{name}_bucket{self._labels({**labels, 'le': bound})} {cumulative}")
+            self._lines.append(f"{name}_bucket{self._labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            self._lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+            self._lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+class PublishCache:
+    """Last-published payload per topic
+    
+    Retained state topics are only published when their payload changed.
+    An optional heartbeat forces a republish of unchanged topics after
+    `heartbeat_interval` seconds (0 disables the heartbeat). Full publish
+    passes are tracked per scope (gateway), so each one republishes its
+    devices once after a heartbeat or a cleared cache.
+    """
+
+    def __init__(self, heartbeat_interval: float = 0, scopes: Tuple[str, ...] = ('',)):
+        self.heartbeat_interval = heartbeat_interval
+        self.scopes = tuple(scopes)
+        self._last: Dict[str, Tuple[Any, float]] = {}
+        # Monotonic time of the next heartbeat pass (0 = none scheduled)
+        self._full_publish_at = time.monotonic() + heartbeat_interval if heartbeat_interval else 0.0
+        # Scopes whose full publish pass is pending
+        self._full_publish_due: set = set()
+        self.sent = 0
+        self.suppressed = 0
+
+    def should_publish(self, topic: str, payload: Any) -> bool:
+        """Return True (and remember the payload) if topic needs publishing"""
+        now = time.monotonic()
+        last = self._last.get(topic)
+        if last is not None and last[0] == payload:
+            if not self.heartbeat_interval or (now - last[1]) < self.heartbeat_interval:
+                self.suppressed += 1
+                return False
+        self._last[topic] = (payload, now)
+        self.sent += 1
+        return True
+
+    def full_publish_due(self, scope: str = '') -> bool:
+        """True (once per pass) if all devices of the scope should be rendered again"""
+        if self._full_publish_at and time.monotonic() >= self._full_publish_at:
+            self._full_publish_at = time.monotonic() + self.heartbeat_interval
+            self._full_publish_due.update(self.scopes)
+        if scope not in self._full_publish_due:
+            return False
+        self._full_publish_due.discard(scope)
+        return True
+
+    def remember(self, topic: str, payload: Any):
+        """Record a payload published outside of should_publish()"""
+        self._last[topic] = (payload, time.monotonic())
+
+    def payloads(self) -> Dict[str, Any]:
+        """Last published payload per topic"""
+        return {topic: last[0] for topic, last in self._last.items()}
+
+    def clear(self):
+        """Forget all published payloads, e.g. after a broker reconnect"""
+        self._last.clear()
+        self._full_publish_due.update(self.scopes)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "topics": len(self._last),
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+        }
+
+
+class TelemetryTopic:
+    __slots__ = ("rule", "samples", "published", "published_at", "pending")
+
+    def __init__(self, rule: Dict[str, Any]):
+        self.rule = rule
+        smoothing = rule.get('smoothing', 0)
+        self.samples: Optional[deque] = deque(maxlen=smoothing) if smoothing > 1 else None
+        self.published: Any = None
+        self.published_at = 0.0
+        self.pending: Any = None
+
+
+class TelemetryFilter:
+    """Deadband, minimum publish interval and moving average for sensor topics
+
+    Rules are configured per measurement (`rssi`, `wind`, `temperature`,
+    `illumination`, ...); `illumination_east` falls back to `illumination`.
+    A value is published once it differs from the last published value by
+    at least `deadband` (absolute) or `deadband_percent`, but not more often
+    than every `min_interval` seconds. Held back values return the last
+    published value, so heartbeats and reconnects republish that one.
+    Values held back by `min_interval` are released by due(). Measurements
+    in `immediate` (rain, smoke) and non-numeric values are never filtered.
+    """
+
+    def __init__(self, rules: Dict[str, Dict[str, Any]], immediate: Tuple[str, ...] = ("rain", "smoke")):
+        self.rules = {name: rule for name, rule in rules.items() if isinstance(rule, dict)}
+        self.immediate = frozenset(immediate)
+        self._rule_cache: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._topics: Dict[str, TelemetryTopic] = {}
+        self.passed = 0
+        self.deadband_suppressed = 0
+        self.interval_held = 0
+
+    def rule(self, measurement: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._rule_cache[measurement]
+        except KeyError:
+            pass
+        rule = None
+        if measurement not in self.immediate:
+            rule = self.rules.get(measurement) or self.rules.get(measurement.split('_')[0])
+        self._rule_cache[measurement] = rule
+        return rule
+
+    def apply(self, topic: str, measurement: str, value: Any) -> Any:
+        """Value to publish for a new reading (the last published one if held back)"""
+        rule = self.rule(measurement)
+        if rule is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+            return value
+        state = self._topics.get(topic)
+        if state is None:
+            state = self._topics[topic] = TelemetryTopic(rule)
+        if state.samples is not None:
+            state.samples.append(value)
+            mean = sum(state.samples) / len(state.samples)
+            value = round(mean) if all(isinstance(v, int) for v in state.samples) else round(mean, 3)
+        now = time.monotonic()
+        if state.published is not None:
+            band = max(rule.get('deadband', 0), abs(state.published) * rule.get('deadband_percent', 0) / 100)
+            if abs(value - state.published) < band or value == state.published:
+                state.pending = None
+                self.deadband_suppressed += 1
+                return state.published
+            if now - state.published_at < rule.get('min_interval', 0):
+                state.pending = value
+                self.interval_held += 1
+                return state.published
+        state.published = value
+        state.published_at = now
+        state.pending = None
+        self.passed += 1
+        return value
+
+    def due(self) -> List[Tuple[str, Any]]:
+        """Held back values whose minimum interval has passed (marked as published)"""
+        now = time.monotonic()
+        released = []
+        for topic, state in self._topics.items():
+            if state.pending is not None and now - state.published_at >= state.rule.get('min_interval', 0):
+                state.published = state.pending
+                state.published_at = now
+                state.pending = None
+                self.passed += 1
+                released.append((topic, state.published))
+        return released
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "topics": len(self._topics),
+            "passed": self.passed,
+            "deadband_suppressed": self.deadband_suppressed,
+            "interval_held": self.interval_held,
+        }
+
+
+class OfflineBuffer:
+    """Latest payload per topic while the broker is unreachable
+
+    Buffered messages are coalesced per topic, so a reconnect replays one
+    (current) message per topic instead of every intermediate state. Above
+    `max_bytes` (topic + payload length) the least recently updated topics
+    are dropped.
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._messages: Dict[str, Tuple[Any, bool]] = {}
+        self.bytes = 0
+        self.buffered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.replayed = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    @staticmethod
+    def _size(topic: str, payload: Any) -> int:
+        return len(topic) + len(payload)
+
+    def put(self, topic: str, payload: Any, retain: bool):
+        previous = self._messages.pop(topic, None)
+        if previous is not None:
+            self.bytes -= self._size(topic, previous[0])
+            self.coalesced += 1
+        else:
+            self.buffered += 1
+        self._messages[topic] = (payload, retain)
+        self.bytes += self._size(topic, payload)
+        while self.bytes > self.max_bytes and self._messages:
+            oldest = next(iter(self._messages))
+            self.bytes -= self._size(oldest, self._messages.pop(oldest)[0])
+            self.dropped += 1
+
+    def discard(self, topic: str):
+        """Forget a buffered message superseded by a live publish"""
+        message = self._messages.pop(topic, None)
+        if message is not None:
+            self.bytes -= self._size(topic, message[0])
+
+    def pop_batch(self, size: int) -> List[Tuple[str, Any, bool]]:
+        batch = []
+        while self._messages and len(batch) < size:
+            topic = next(iter(self._messages))
+            payload, retain = self._messages.pop(topic)
+            self.bytes -= self._size(topic, payload)
+            batch.append((topic, payload, retain))
+        self.replayed += len(batch)
+        return batch
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "messages": len(self._messages),
+            "bytes": self.bytes,
+            "buffered": self.buffered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+        }
+
+
+class PollScheduler:
+    """Decides when the next GetStates poll is due
+    
+    After a command or an observed state change the gateway is polled every
+    `fast_interval` seconds for `fast_window` seconds. Afterwards the interval
+    backs off exponentially by `backoff` per poll up to `idle_interval`.
+    Polls run on a tick grid aligned to wall-clock time, so the time spent
+    polling does not stretch the interval.
+    """
+
+    def __init__(self, idle_interval: float, fast_interval: float, fast_window: float, backoff: float = 2.0):
+        self.idle_interval = idle_interval
+        self.fast_interval = min(fast_interval, idle_interval)
+        self.fast_window = fast_window
+        self.backoff = max(backoff, 1.0)
+        self.interval = idle_interval
+        self._last_activity = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._poll_times: deque = deque()
+        self.last_latency: Optional[float] = None
+        self.avg_latency: Optional[float] = None
+        self.max_latency = 0.0
+
+    def notify_activity(self):
+        """Switch to fast polling (command sent or state change seen)"""
+        self._last_activity = time.monotonic()
+        if self.interval != self.fast_interval:
+            self.interval = self.fast_interval
+            if self._wakeup:
+                self._wakeup.set()
+
+    def record_poll(self, latency: float):
+        """Record a finished poll and its gateway response latency"""
+        now = time.monotonic()
+        self._poll_times.append(now)
+        while self._poll_times and now - self._poll_times[0] > 60:
+            self._poll_times.popleft()
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency += 0.2 * (latency - self.avg_latency)
+        # Back off once the fast window after the last activity has passed
+        if now - self._last_activity >= self.fast_window:
+            self.interval = min(self.interval * self.backoff, self.idle_interval)
+
+    def next_delay(self) -> float:
+        """Seconds until the next tick of the current interval's wall-clock grid"""
+        now = time.time()
+        next_tick = (math.floor(now / self.interval) + 1) * self.interval
+        return next_tick - now
+
+    async def wait(self):
+        """Sleep until the next poll is due, waking early on new activity"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.next_delay())
+        except asyncio.TimeoutError:
+            return
+        # Activity switched to fast polling - continue on the fast grid
+        await asyncio.sleep(self.next_delay())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval": round(self.interval, 3),
+            "polls_per_minute": len(self._poll_times),
+            "latency_last": round(self.last_latency, 3) if self.last_latency is not None else None,
+            "latency_avg": round(self.avg_latency, 3) if self.avg_latency is not None else None,
+            "latency_max": round(self.max_latency, 3),
+        }
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops hammering an unreachable gateway
+
+    After `failure_threshold` consecutive failed requests the breaker opens
+    and requests are rejected without touching the network. After a jittered,
+    exponentially growing delay (`reset_timeout` doubled per reopen up to
+    `max_reset_timeout`) it lets a single probe request through (half-open):
+    success closes it, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 5,
+                 max_reset_timeout: float = 300, probe_timeout: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.probe_timeout = probe_timeout
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self._reopens = 0
+        self._open_until = 0.0
+        self._probe_started: Optional[float] = None
+        # Called with the new state on open/close transitions
+        self.on_change: Optional[Callable[[BreakerState], None]] = None
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def available(self) -> bool:
+        return self.state is not BreakerState.OPEN
+
+    def allow(self) -> bool:
+        """True if a request may be sent now"""
+        if self.state is BreakerState.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state is BreakerState.OPEN and now >= self._open_until:
+            self.state = BreakerState.HALF_OPEN
+            self._probe_started = None
+        if self.state is BreakerState.HALF_OPEN:
+            # One probe at a time; a probe that never reported back is replaced
+            if self._probe_started is None or now - self._probe_started > self.probe_timeout:
+                self._probe_started = now
+                return True
+        self.rejected += 1
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe through (0 if not open)"""
+        if self.state is not BreakerState.OPEN:
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def record_success(self):
+        self.failures = 0
+        self._reopens = 0
+        self._probe_started = None
+        if self.state is not BreakerState.CLOSED:
+            self.state = BreakerState.CLOSED
+            if self.on_change:
+                self.on_change(self.state)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state is BreakerState.HALF_OPEN or (
+                self.state is BreakerState.CLOSED and self.failures >= self.failure_threshold):
+            was_open = self.state is BreakerState.HALF_OPEN
+            self.state = BreakerState.OPEN
+            self._probe_started = None
+            self._open_until = time.monotonic() + backoff_delay(self._reopens, self.reset_timeout, self.max_reset_timeout)
+            self._reopens += 1
+            self.opened += 1
+            if self.on_change and not was_open:
+                self.on_change(self.state)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+class CommandQueue:
+    """Pending device commands, coalesced per SID
+    
+    Only the latest pending command per SID is kept; older ones are dropped
+    as superseded (e.g. intermediate dimToX values of a slider drag).
+    At most `max_in_flight` commands are sent to the gateway concurrently,
+    at least `min_spacing` seconds apart. Commands for the same SID are
+    never sent concurrently, so their order is preserved.
+    """
+
+    def __init__(self, handler: Callable[[str, str, bool], Awaitable[bool]], max_in_flight: int = 2,
+                 min_spacing: float = 0.1):
+        self._handler = handler
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_spacing = max(0.0, min_spacing)
+        # sid -> (command, queued at, publish optimistic state, future resolved when handled)
+        self._pending: Dict[str, Tuple[str, float, bool, Optional[asyncio.Future]]] = {}
+        self._in_flight: set = set()
+        self._changed = asyncio.Event()
+        self._spacing_lock = asyncio.Lock()
+        self._last_send = 0.0
+        self._workers: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.sent = 0
+        self.superseded = 0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+        self.wait_histogram = Histogram(Histogram.LATENCY_BUCKETS)
+
+    def put(self, sid: str, command: str, publish: bool = True, done: Optional[asyncio.Future] = None):
+        """Queue a command, replacing a not yet sent command for the same SID
+
+        `done` is resolved with True once the gateway accepted the command,
+        or with False if it failed or a newer command superseded it.
+        """
+        self.enqueued += 1
+        previous = self._pending.get(sid)
+        if previous is not None:
+            self.superseded += 1
+            logger.debug("Dropping superseded command for %s: '%s'", sid, previous[0], extra=log_extra(sid, "queue"))
+            if previous[3] is not None and not previous[3].done():
+                previous[3].set_result(False)
+            # Keep queue position and time so latency reflects the first request
+            self._pending[sid] = (command, previous[1], publish, done)
+        else:
+            self._pending[sid] = (command, time.monotonic(), publish, done)
+        self._changed.set()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def has_pending(self, sid: str) -> bool:
+        """True if a newer command for the SID is waiting"""
+        return sid in self._pending
+
+    def start(self):
+        for _ in range(self.max_in_flight):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        for _, _, _, done in self._pending.values():
+            if done is not None:
+                done.cancel()
+
+    def _next_ready(self) -> Optional[str]:
+        for sid in self._pending:
+            if sid not in self._in_flight:
+                return sid
+        return None
+
+    async def _throttle(self):
+        async with self._spacing_lock:
+            delay = self._last_send + self.min_spacing - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_send = time.monotonic()
+
+    async def _worker(self):
+        while True:
+            if self._next_ready() is None:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            await self._throttle()
+            # Pick the command only after throttling, so it is the latest one
+            sid = self._next_ready()
+            if sid is None:
+                continue
+            command, queued_at, publish, done = self._pending.pop(sid)
+            wait = time.monotonic() - queued_at
+            self._total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.wait_histogram.observe(wait)
+            self._in_flight.add(sid)
+            accepted = False
+            try:
+                accepted = await self._handler(sid, command, publish)
+            except Exception as e:
+                logger.error("Error handling queued command for %s: %s", sid, e, extra=log_extra(sid, "queue"))
+            finally:
+                self.sent += 1
+                self._in_flight.discard(sid)
+                self._changed.set()
+                if done is not None and not done.done():
+                    done.set_result(bool(accepted))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "in_flight": len(self._in_flight),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "superseded": self.superseded,
+            "wait_avg": round(self._total_wait / self.sent, 3) if self.sent else None,
+            "wait_max": round(self.max_wait, 3),
+        }
+
+
+class HistorySeries:
+    """Per-minute aggregates of one device field over the history window
+
+    Only minutes in which the value changed have an entry: the minute
+    (uint32, buckets since the history epoch), the last, lowest and highest
+    value (float32) and the number of changes (uint16), 18 bytes in typed
+    arrays. A value holds until the next entry, so a field that changes
+    every minute needs one entry per minute of the window and a rarely
+    changing one only a few. Entries before the window are trimmed in
+    batches, keeping the one in effect at the window start.
+    """
+
+    # 18 bytes plus the arrays' over-allocation
+    ENTRY_BYTES = 20
+    TRIM_BATCH = 10
+    __slots__ = ("buckets", "last", "low", "high", "changes", "trimmed")
+
+    def __init__(self):
+        self.buckets = array('I')
+        self.last = array('f')
+        self.low = array('f')
+        self.high = array('f')
+        self.changes = array('H')
+        self.trimmed = False
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def has_bucket(self, bucket: int) -> bool:
+        return bool(self.buckets) and self.buckets[-1] == bucket
+
+    def add(self, bucket: int, value: float) -> int:
+        """Record a value seen in `bucket`, return the number of added entries"""
+        if self.has_bucket(bucket):
+            self.last[-1] = value
+            if value < self.low[-1]:
+                self.low[-1] = value
+            if value > self.high[-1]:
+                self.high[-1] = value
+            if self.changes[-1] < 0xFFFF:
+                self.changes[-1] += 1
+            return 0
+        self.buckets.append(bucket)
+        self.last.append(value)
+        self.low.append(value)
+        self.high.append(value)
+        self.changes.append(1)
+        return 1
+
+    def trim(self, cutoff: int, batch: int = TRIM_BATCH) -> int:
+        """Drop entries before bucket `cutoff` once `batch` of them are stale, return the number dropped"""
+        stale = bisect.bisect_right(self.buckets, cutoff) - 1
+        if stale < max(1, batch):
+            return 0
+        for column in (self.buckets, self.last, self.low, self.high, self.changes):
+            del column[:stale]
+        self.trimmed = True
+        return stale
+
+    def summary(self, since: float, until: float, resolution: int, percentiles: Tuple[float, ...] = (),
+                points: bool = False) -> Optional[Dict[str, Any]]:
+        """Time weighted statistics between since and until (seconds since the history epoch)
+
+        The last value of a minute counts until the next entry; the entry in
+        effect at `since` counts from there with its last value. `coverage`
+        is the part of the window (in seconds) after the oldest retained
+        entry; `truncated` means older entries of the window were trimmed.
+        None if there is no entry before `until`.
+        """
+        if not self.buckets:
+            return None
+        oldest = self.buckets[0] * resolution
+        first = max(0, bisect.bisect_right(self.buckets, since / resolution) - 1)
+        end = bisect.bisect_right(self.buckets, until / resolution)
+        buckets = self.buckets[first:end]
+        if not buckets:
+            return None
+        last, low, high = self.last[first:end], self.low[first:end], self.high[first:end]
+        changes = sum(self.changes[first:end])
+        starts = array('d', map(operator.mul, buckets, itertools.repeat(resolution)))
+        if starts[0] <= since:
+            # Carried into the window: only its last value counts
+            starts[0] = since
+            low[0] = high[0] = last[0]
+            changes -= self.changes[first]
+        durations = array('d', map(operator.sub, starts[1:] + array('d', [until]), starts))
+        total = sum(durations)
+        result = {
+            "changes": changes,
+            "min": round(min(low), 3),
+            "max": round(max(high), 3),
+            "mean": round(sum(map(operator.mul, last, durations)) / total, 3) if total else round(last[-1], 3),
+            "last": round(last[-1], 3),
+            "oldest": oldest,
+            "coverage": round(until - max(since, oldest), 1),
+            "truncated": self.trimmed and oldest > since,
+        }
+        if percentiles:
+            order = sorted(range(len(last)), key=last.__getitem__)
+            covered = list(itertools.accumulate(map(durations.__getitem__, order)))
+            for pct in percentiles:
+                index = order[min(bisect.bisect_left(covered, total * pct / 100), len(order) - 1)]
+                result[f"p{pct:g}"] = round(last[index], 3)
+        if points:
+            result["points"] = [[bucket * resolution, round(value, 3), round(lowest, 3), round(highest, 3)]
+                                for bucket, value, lowest, highest in zip(buckets, last, low, high)]
+        return result
+
+
+class DeviceHistory:
+    """Recent numeric state changes per device and field, in bounded memory
+
+    Every field change seen by a poll goes into the per-minute series of
+    its device and field (on/off and booleans as 1/0), kept for `hours`.
+    Series are created on first use; once their entries take `max_bytes`,
+    changes that need a new entry are dropped. Queries summarize a time
+    window and report how much of it the retained entries cover.
+    """
+
+    # DeviceState field -> series name (as in the state topics)
+    FIELDS = {
+        "rssiPercentage": "rssi",
+        "state": "state",
+        "level": "level",
+        "pos": "pos",
+        "temperature": "temperature",
+        "wind": "wind",
+        "rain_state": "rain",
+        "illumination": "illumination",
+        "s1": "illumination_east",
+        "s2": "illumination_south",
+        "s3": "illumination_west",
+        "smoke": "smoke",
+    }
+    # Arrays, slots object and dict entry of an empty series
+    SERIES_BYTES = 512
+
+    def __init__(self, hours: int = 24, max_bytes: int = 100 * 1024 * 1024, resolution: int = 60):
+        self.hours = hours
+        self.resolution = resolution
+        self.window = hours * 3600 // resolution
+        self.max_bytes = max_bytes
+        # Minute aligned, so buckets are wall clock minutes
+        self.epoch = int(time.time()) // resolution * resolution
+        self._series: Dict[Tuple[str, str], Dict[str, HistorySeries]] = {}
+        self.series = 0
+        self.entries = 0
+        self.recorded = 0
+        self.dropped = 0
+
+    @property
+    def bytes(self) -> int:
+        return self.entries * HistorySeries.ENTRY_BYTES + self.series * self.SERIES_BYTES
+
+    @staticmethod
+    def _value(value: Any) -> Optional[float]:
+        if isinstance(value, (bool, int, float)):
+            return float(value)
+        if isinstance(value, str):
+            if value in ("on", "off"):
+                return 1.0 if value == "on" else 0.0
+            if is_numeric(value):
+                return float(value)
+        return None
+
+    def _drop(self):
+        if not self.dropped:
+            logger.warning(f"History memory cap reached ({self.max_bytes // (1024 * 1024)} MB), "
+                           f"changes are not recorded")
+        self.dropped += 1
+
+    def record(self, gateway: str, device: 'DeviceRecord', changed: Optional[Tuple[str, ...]]):
+        """Record the changed fields (all fields of a new record) of a polled device"""
+        names = changed if changed is not None else [name for name, _ in device.state.FIELDS]
+        bucket = int(time.time() - self.epoch) // self.resolution
+        cutoff = bucket - self.window
+        rings = self._series.get((gateway, device.sid))
+        for name in names:
+            field = self.FIELDS.get(name)
+            value = self._value(getattr(device.state, name)) if field else None
+            if value is None:
+                continue
+            if rings is None:
+                rings = self._series[(gateway, device.sid)] = {}
+            series = rings.get(field)
+            if series is None:
+                if self.bytes + self.SERIES_BYTES + HistorySeries.ENTRY_BYTES > self.max_bytes:
+                    self._drop()
+                    continue
+                series = rings[field] = HistorySeries()
+                self.series += 1
+            elif not series.has_bucket(bucket):
+                self.entries -= series.trim(cutoff)
+                if self.bytes + HistorySeries.ENTRY_BYTES > self.max_bytes:
+                    # At the cap: free this series' stale entries right away
+                    self.entries -= series.trim(cutoff, 1)
+                    if self.bytes + HistorySeries.ENTRY_BYTES > self.max_bytes:
+                        self._drop()
+                        continue
+            self.entries += series.add(bucket, value)
+            self.recorded += 1
+
+    def query(self, gateway: str, sid: str, field: Optional[str] = None, window: float = 3600,
+              percentiles: Tuple[float, ...] = (50, 95), points: bool = False) -> Optional[Dict[str, Any]]:
+        """Summary per field of a device over the last `window` seconds, None if unknown"""
+        rings = self._series.get((gateway, sid))
+        if rings is None or (field is not None and field not in rings):
+            return None
+        until = time.time() - self.epoch
+        fields = {}
+        for name, series in rings.items():
+            if field is None or name == field:
+                summary = series.summary(until - window, until, self.resolution, percentiles, points)
+                if summary is not None:
+                    summary["oldest"] += self.epoch
+                    if points:
+                        for point in summary["points"]:
+                            point[0] += self.epoch
+                fields[name] = summary
+        return {"gateway": gateway, "sid": sid, "window": window, "fields": fields}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "series": self.series,
+            "entries": self.entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hours": self.hours,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+        }
+
+
+class StateSnapshot:
+    """Small on-disk snapshot of device inventory, states and published topics
+
+    Written atomically (temp file + rename) so a crash during the write
+    keeps the previous snapshot. A missing, unreadable or outdated snapshot
+    just means a cold start.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.saves = 0
+        self.last_bytes = 0
+        self.last_save_time = 0.0
+        self.loaded_age: Optional[float] = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return None
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            logger.warning(f"Ignoring snapshot {self.path} with unknown version")
+            return None
+        self.loaded_age = time.time() - data.get("saved_at", 0)
+        return data
+
+    def save(self, data: Dict[str, Any]):
+        """Write the snapshot (blocking, run it in an executor)"""
+        start = time.monotonic()
+        data = {"version": self.VERSION, "saved_at": time.time(), **data}
+        encoded = json.dumps(data, separators=(',', ':'))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(encoded)
+        os.replace(tmp_path, self.path)
+        self.saves += 1
+        self.last_bytes = len(encoded)
+        self.last_save_time = time.monotonic() - start
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "saves": self.saves,
+            "bytes_last": self.last_bytes,
+            "save_time_last": round(self.last_save_time, 4),
+            "loaded_age": round(self.loaded_age) if self.loaded_age is not None else None,
+        }
+
+
+class TrafficCapture:
+    """Append-only record of gateway responses and inbound MQTT commands
+
+    One JSON object per line: `t` (seconds since the capture started),
+    `type` and its data. Types are `start` (once per run and file), `getstates`
+    (the error of a GetStates request, or the records that changed since
+    the previous response and the SIDs that disappeared; every
+    `keyframe_interval` seconds a `full` response), `sendsc` (status and
+    response of a command request) and `command` (an MQTT set message).
+    Lines are collected on the event loop and appended by write(); once
+    the file reaches `max_bytes` it is moved to `<path>.1` and a new one
+    starts with a `start` record and full responses. replay.py feeds a
+    capture back through the bridge.
+    """
+
+    VERSION = 2
+    # Config sections stored in the start record, so replay.py runs with the captured settings
+    CONFIG_SECTIONS = ("groups", "polling", "commands", "retry", "publish", "telemetry", "discovery")
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024, keyframe_interval: float = 300):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        self._started = time.monotonic()
+        # Lines to append; None marks a file rotation
+        self._lines: List[Optional[str]] = []
+        try:
+            self.bytes = os.path.getsize(path)
+        except OSError:
+            self.bytes = 0
+        self._start: Optional[Dict[str, Any]] = None
+        # Per gateway: record fingerprints of the last response and the next keyframe
+        self._fingerprints: Dict[str, Dict[str, Tuple[Any, Any, Any]]] = {}
+        self._keyframe_due: Dict[str, float] = {}
+        self.records = 0
+        self.keyframes = 0
+        self.rotations = 0
+
+    def record(self, kind: str, **data: Any):
+        if self.bytes >= self.max_bytes:
+            self._rotate()
+        if kind == "start":
+            self._start = data
+        self._append(kind, data)
+
+    def _append(self, kind: str, data: Dict[str, Any]):
+        line = json.dumps({"t": round(time.monotonic() - self._started, 4), "type": kind, **data},
+                          separators=(',', ':'))
+        self._lines.append(line)
+        self.bytes += len(line) + 1
+        self.records += 1
+
+    def _rotate(self):
+        """Start a new file that replays on its own: start record, then full responses"""
+        logger.info(f"Capture {self.path} reached {self.max_bytes // (1024 * 1024)} MB, "
+                    f"moving it to {self.path}.1")
+        self._lines.append(None)
+        self.rotations += 1
+        self.bytes = 0
+        self._started = time.monotonic()
+        self._keyframe_due.clear()
+        if self._start is not None:
+            self._append("start", {**self._start, "time": time.time()})
+
+    def record_states(self, gateway: str, elapsed: float, records: List[Dict[str, Any]]):
+        """Record a GetStates response as the changes since the previous one, or as keyframe"""
+        if self.bytes >= self.max_bytes:
+            self._rotate()
+        now = time.monotonic()
+        previous = self._fingerprints.get(gateway, {})
+        fingerprints = {record.get("sid"): record_fingerprint(record) for record in records}
+        self._fingerprints[gateway] = fingerprints
+        if now >= self._keyframe_due.get(gateway, 0):
+            self._keyframe_due[gateway] = now + self.keyframe_interval
+            self.keyframes += 1
+            self.record("getstates", gateway=gateway, elapsed=elapsed, full=True, records=records)
+            return
+        changed = [record for record in records
+                   if previous.get(record.get("sid")) != fingerprints[record.get("sid")]]
+        removed = [sid for sid in previous if sid not in fingerprints]
+        if removed:
+            self.record("getstates", gateway=gateway, elapsed=elapsed, records=changed, removed=removed)
+        else:
+            self.record("getstates", gateway=gateway, elapsed=elapsed, records=changed)
+
+    def take(self) -> List[Optional[str]]:
+        """Lines recorded since the last call"""
+        lines, self._lines = self._lines, []
+        return lines
+
+    def write(self, lines: List[Optional[str]]):
+        """Append lines to the capture file, rotating it where marked (blocking, run it in an executor)"""
+        start = 0
+        for index, line in enumerate(lines):
+            if line is None:
+                self._write_lines(lines[start:index])
+                if os.path.exists(self.path):
+                    os.replace(self.path, f"{self.path}.1")
+                start = index + 1
+        self._write_lines(lines[start:])
+
+    def _write_lines(self, lines: List[Optional[str]]):
+        if lines:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "records": self.records,
+            "keyframes": self.keyframes,
+            "bytes": self.bytes,
+            "rotations": self.rotations,
+        }
+
+
+class SamplingProfiler:
+    """On-demand sampling profiler for the event loop thread
+
+    A helper thread samples the stack of the event loop thread every
+    `interval` seconds and counts identical stacks. The result is written
+    in the collapsed stack format ("outer;inner;leaf count", readable by
+    flamegraph.pl and speedscope) to `directory`.
+    """
+
+    def __init__(self, directory: str, interval: float = 0.005):
+        self.directory = directory
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.runs = 0
+        self.last_path: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float) -> bool:
+        """Profile the calling (event loop) thread for `duration` seconds"""
+        if self.active:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(), duration),
+            name="eltako2mqtt-profiler", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, thread_id: int, duration: float):
+        stacks: Dict[str, int] = {}
+        samples = 0
+        deadline = time.monotonic() + duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            stacks[stack] = stacks.get(stack, 0) + 1
+            samples += 1
+            self._stop.wait(self.interval)
+        path = os.path.join(self.directory, f"eltako2mqtt_profile_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        try:
+            with open(path, 'w') as f:
+                for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error(f"Failed to write profile {path}: {e}")
+            return
+        self.runs += 1
+        self.last_path = path
+        logger.info(f"Profile with {samples} samples written to {path}")
+
+
+class GatewayPoolStats:
+    """Connection pool health towards the gateway, collected via aiohttp tracing
+    
+    Connect latency (TCP setup) vs. request latency (request sent until
+    response headers) separates network from gateway slowness.
+    """
+
+    def __init__(self):
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.request_errors = 0
+        self.connect_latency = Histogram(Histogram.LATENCY_BUCKETS)
+        self.request_latency = Histogram(Histogram.LATENCY_BUCKETS)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    async def _on_connection_create_start(self, session, ctx, params):
+        ctx.connect_start = time.monotonic()
+
+    async def _on_connection_create_end(self, session, ctx, params):
+        self.new_connections += 1
+        self.connect_latency.observe(time.monotonic() - ctx.connect_start)
+
+    async def _on_connection_reuseconn(self, session, ctx, params):
+        self.reused_connections += 1
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.request_start = time.monotonic()
+
+    async def _on_request_end(self, session, ctx, params):
+        self.request_latency.observe(time.monotonic() - ctx.request_start)
+
+    async def _on_request_exception(self, session, ctx, params):
+        self.request_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        connect = self.connect_latency.stats()
+        request = self.request_latency.stats()
+        return {
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "request_errors": self.request_errors,
+            "connect_latency_avg": connect["avg"],
+            "request_latency_avg": request["avg"],
+        }
+
+
+class AsyncioMQTTTransport:
+    """Drives the socket of a paho client from the asyncio event loop
+
+    Replaces paho's loop_start() thread: the socket callbacks register the
+    socket with the loop's reader/writer and a task runs loop_misc() for
+    keep-alives and reconnects, so all MQTT callbacks run on the event loop.
+    Publishers await drain() to stop producing while more than
+    `max_pending` messages wait for the socket.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int = 1000,
+                 reconnect_min: float = 1, reconnect_max: float = 60):
+        self.loop = loop
+        self.max_pending = max_pending
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.client: Optional[mqtt.Client] = None
+        self._misc_task: Optional[asyncio.Task] = None
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.drain_waits = 0
+        self.drain_time = 0.0
+        self.reconnects = 0
+
+    def attach(self, client: mqtt.Client):
+        self.client = client
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _call(self, callback: Callable, *args):
+        # connect()/reconnect() run in an executor, the loop API is not thread-safe
+        try:
+            running = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            running = False
+        if running:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    # File descriptors instead of sockets: paho closes the socket right after on_socket_close
+    def _on_socket_open(self, client: mqtt.Client, userdata: Any, sock):
+        self._call(self.loop.add_reader, sock.fileno(), client.loop_read)
+
+    def _on_socket_close(self, client: mqtt.Client, userdata: Any, sock):
+        self._call(self.loop.remove_reader, sock.fileno())
+        self._call(self._release)
+
+    def _on_socket_register_write(self, client: mqtt.Client, userdata: Any, sock):
+        self._call(self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def _on_socket_unregister_write(self, client: mqtt.Client, userdata: Any, sock):
+        self._call(self.loop.remove_writer, sock.fileno())
+        self._call(self._release)
+
+    def _release(self):
+        # Everything queued was written (or dropped with the connection)
+        self.pending = 0
+        self._drained.set()
+
+    def queued(self):
+        """Count a message handed to client.publish()"""
+        self.pending += 1
+        if self.pending > self.max_pending_seen:
+            self.max_pending_seen = self.pending
+        if self.pending >= self.max_pending:
+            self._drained.clear()
+
+    async def drain(self):
+        """Wait until the socket caught up if too many messages are pending"""
+        if self._drained.is_set():
+            return
+        self.drain_waits += 1
+        start = time.perf_counter()
+        await self._drained.wait()
+        self.drain_time += time.perf_counter() - start
+
+    async def connect(self, host: str, port: int, keepalive: int = 60):
+        await self.loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+
+    def start(self):
+        if self._misc_task is None:
+            self._misc_task = self.loop.create_task(self._misc_loop())
+
+    async def stop(self):
+        if self._misc_task:
+            self._misc_task.cancel()
+            try:
+                await self._misc_task
+            except asyncio.CancelledError:
+                pass
+            self._misc_task = None
+        self.client.disconnect()
+        # Flush the DISCONNECT packet, the writer callback won't run anymore
+        self.client.loop_write()
+
+    async def _misc_loop(self):
+        delay = self.reconnect_min
+        while True:
+            await asyncio.sleep(1)
+            if self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                delay = self.reconnect_min
+                continue
+            await asyncio.sleep(delay)
+            try:
+                self.reconnects += 1
+                await self.loop.run_in_executor(None, self.client.reconnect)
+            except Exception as e:
+                logger.warning(f"MQTT reconnect failed: {e}")
+                delay = min(delay * 2, self.reconnect_max)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loop": "asyncio",
+            "pending": self.pending,
+            "pending_max": self.max_pending_seen,
+            "drain_waits": self.drain_waits,
+            "reconnects": self.reconnects,
+        }
+
+
+class CommandState(Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    CONFIRMED = "confirmed"
+    TIMED_OUT = "timed_out"
+
+
+class TrackedCommand:
+    __slots__ = ("command", "device_type", "state", "queued_at", "sent_at", "expected", "baseline")
+
+    def __init__(self, command: str, device_type: str):
+        self.command = command
+        self.device_type = device_type
+        self.state = CommandState.PENDING
+        self.queued_at = time.monotonic()
+        self.sent_at = 0.0
+        self.expected: Optional[Dict[str, Any]] = None
+        self.baseline: Optional[Dict[str, Any]] = None
+
+
+class CommandTracker:
+    """In-flight command state per SID: pending -> sent -> confirmed / timed_out
+    
+    A sent command with an expected (optimistic) state is confirmed by the
+    first poll reporting that state. Until then, or until `confirm_timeout`
+    expires, polls reporting the old state are considered stale. Entries are
+    kept for `retention` seconds after sending for feedback logging.
+    """
+
+    # 'on' directly after a dim value (HA sends brightness, then 'on') is redundant
+    REDUNDANT_ON_WINDOW = 1.5
+
+    def __init__(self, confirm_timeout: float = 15, retention: float = 65):
+        self.confirm_timeout = confirm_timeout
+        self.retention = max(retention, confirm_timeout)
+        self._commands: Dict[str, TrackedCommand] = {}
+        self.latency: Dict[str, Histogram] = {}
+        self.confirmed = 0
+        self.timed_out = 0
+        self.stale_polls = 0
+
+    def is_redundant(self, sid: str, command: str) -> bool:
+        """True for an 'on' command following a not yet confirmed dim value"""
+        if command.strip().lower() != 'on':
+            return False
+        tracked = self._commands.get(sid)
+        if tracked is None:
+            return False
+        try:
+            if float(tracked.command) <= 0:
+                return False
+        except ValueError:
+            return False
+        if tracked.state in (CommandState.PENDING, CommandState.SENT):
+            return True
+        return (time.monotonic() - tracked.queued_at) < self.REDUNDANT_ON_WINDOW
+
+    def add(self, sid: str, command: str, device_type: str):
+        self._commands[sid] = TrackedCommand(command, device_type)
+
+    def mark_sent(self, sid: str, command: str, baseline: Optional[Dict[str, Any]], expected: Optional[Dict[str, Any]]):
+        """Command accepted by the gateway; `expected` is the optimistic state (if any)"""
+        tracked = self._commands.get(sid)
+        if tracked is None or tracked.command != command:
+            # Already replaced by a newer command
+            return
+        tracked.state = CommandState.SENT
+        tracked.sent_at = time.monotonic()
+        tracked.baseline = dict(baseline) if baseline else {}
+        tracked.expected = expected
+
+    def discard(self, sid: str, command: str):
+        tracked = self._commands.get(sid)
+        if tracked is not None and tracked.command == command:
+            del self._commands[sid]
+
+    def is_recent(self, sid: str) -> bool:
+        tracked = self._commands.get(sid)
+        return tracked is not None and tracked.state != CommandState.PENDING
+
+    def is_tracked(self, sid: str) -> bool:
+        return sid in self._commands
+
+    @staticmethod
+    def _matches(expected: Dict[str, Any], state: Dict[str, Any]) -> bool:
+        for key, value in expected.items():
+            actual = state.get(key)
+            if key == 'level':
+                try:
+                    if abs(float(actual) - float(value)) > 1:
+                        return False
+                except (TypeError, ValueError):
+                    return False
+            elif actual != value:
+                return False
+        return True
+
+    def accept_poll(self, sid: str, state: Dict[str, Any]) -> bool:
+        """Check a polled state against the SID's in-flight command
+        
+        Returns False if the poll is stale and must not overwrite the
+        optimistic state published for the command.
+        """
+        tracked = self._commands.get(sid)
+        if tracked is None or tracked.state != CommandState.SENT:
+            return True
+        now = time.monotonic()
+        if tracked.expected is not None:
+            confirmed = self._matches(tracked.expected, state)
+        else:
+            # No optimistic state (blinds): any reported change confirms
+            baseline = tracked.baseline
+            confirmed = any(k in baseline and baseline[k] != v for k, v in state.items() if k != "rssiPercentage")
+        if confirmed:
+            tracked.state = CommandState.CONFIRMED
+            self.confirmed += 1
+            histogram = self.latency.get(tracked.device_type)
+            if histogram is None:
+                histogram = self.latency[tracked.device_type] = Histogram()
+            histogram.observe(now - tracked.sent_at)
+            return True
+        if (now - tracked.sent_at) >= self.confirm_timeout:
+            tracked.state = CommandState.TIMED_OUT
+            self.timed_out += 1
+            logger.debug("Command '%s' for %s not confirmed within %ss", tracked.command, sid, self.confirm_timeout,
+                         extra=log_extra(sid, "confirm", kind=tracked.device_type))
+            return True
+        if tracked.expected is None:
+            return True
+        self.stale_polls += 1
+        return False
+
+    def expire(self):
+        """Time out unconfirmed commands and forget old entries"""
+        now = time.monotonic()
+        for sid, tracked in list(self._commands.items()):
+            if tracked.state == CommandState.SENT and (now - tracked.sent_at) >= self.confirm_timeout:
+                tracked.state = CommandState.TIMED_OUT
+                self.timed_out += 1
+            elif tracked.state != CommandState.PENDING and (now - tracked.sent_at) >= self.retention:
+                del self._commands[sid]
+
+    def stats(self) -> Dict[str, Any]:
+        states = {state.value: 0 for state in CommandState}
+        for tracked in self._commands.values():
+            states[tracked.state.value] += 1
+        return {
+            "tracked": states,
+            "confirmed": self.confirmed,
+            "timed_out": self.timed_out,
+            "stale_polls": self.stale_polls,
+            "confirm_latency": {device_type: h.stats() for device_type, h in self.latency.items()},
+        }
+
+
+class DeviceKind(Enum):
+    BLIND = "blind"
+    SWITCH = "switch"
+    DIMMER = "dimmer"
+    WEATHER = "weather"
+    SMOKE = "smoke"
+    UNKNOWN = "unknown"
+
+
+# Keyword -> kind, checked in order against the lower-cased device type.
+# Switch keywords cover all FSR14 variants (FSR14, FSR14M-2x, FSR14SSR),
+# F4SR14-LED and the FAE14LPR/FAE14SSR switch actuators.
+DEVICE_KIND_KEYWORDS: Tuple[Tuple[str, DeviceKind], ...] = (
+    ('blind', DeviceKind.BLIND),
+    ('switch', DeviceKind.SWITCH),
+    ('fsr14', DeviceKind.SWITCH),
+    ('f4sr14', DeviceKind.SWITCH),
+    ('fae14', DeviceKind.SWITCH),
+    ('dimmer', DeviceKind.DIMMER),
+    ('weather', DeviceKind.WEATHER),
+    ('tf_smoke', DeviceKind.SMOKE),
+)
+
+
+# Send order of group commands (lower first)
+GROUP_SEND_ORDER: Dict[DeviceKind, int] = {DeviceKind.BLIND: 0, DeviceKind.DIMMER: 1, DeviceKind.SWITCH: 2}
+
+
+@functools.lru_cache(maxsize=None)
+def classify_device_type(device_type: str) -> DeviceKind:
+    """Map a MiniSafe2 device type (the 'data' field) to its device kind"""
+    device_type_lower = (device_type or '').lower()
+    for keyword, kind in DEVICE_KIND_KEYWORDS:
+        if keyword in device_type_lower:
+            return kind
+    return DeviceKind.UNKNOWN
+
+
+def is_numeric(value: str) -> bool:
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def level_to_brightness(level: Any) -> int:
+    """Convert 0-100 to 0-255 brightness"""
+    # Validiere Input
+    if level is None or (isinstance(level, str) and not level.isdigit()):
+        logger.warning(f"Invalid brightness level: {level}, using 0")
+        level = 0
+
+    # Konvertiere sicher
+    try:
+        level = int(float(level))
+    except (ValueError, TypeError):
+        level = 0
+
+    # Clamp und konvertiere
+    level = max(0, min(level, 100))
+    return round(level * 255 / 100)
+
+
+def dimmer_level(value: float) -> Optional[int]:
+    """Convert a numeric dimmer command (0-255 brightness) to a 0-100 level"""
+    if 0 <= value <= 255:
+        return round(value * 100 / 255)
+    return None
+
+
+class DeviceState:
+    """Slotted device state, updated in place from GetStates records
+    
+    Subclasses list the state fields their device kind uses in FIELDS as
+    (GetStates key, default) pairs; all other keys are ignored.
+    """
+
+    FIELDS: Tuple[Tuple[str, Any], ...] = (("rssiPercentage", 0),)
+    __slots__ = ("rssiPercentage",)
+
+    def __init__(self):
+        for name, default in self.FIELDS:
+            setattr(self, name, default)
+
+    def update(self, raw: Dict[str, Any]) -> Tuple[str, ...]:
+        """Take over the used fields of a GetStates 'state' dict, return the changed field names"""
+        changed = []
+        for name, default in self.FIELDS:
+            value = raw.get(name, default)
+            old = getattr(self, name)
+            if old != value or type(old) is not type(value):
+                setattr(self, name, value)
+                changed.append(name)
+        return tuple(changed)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name, _ in self.FIELDS}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+
+class BlindState(DeviceState):
+    FIELDS = DeviceState.FIELDS + (("pos", 0), ("sync", False), ("rv", 0), ("rt", 0))
+    __slots__ = ("pos", "sync", "rv", "rt")
+
+
+class SwitchState(DeviceState):
+    FIELDS = DeviceState.FIELDS + (("state", "off"),)
+    __slots__ = ("state",)
+
+
+class DimmerState(DeviceState):
+    FIELDS = DeviceState.FIELDS + (("state", "off"), ("level", 0))
+    __slots__ = ("state", "level")
+
+
+class WeatherState(DeviceState):
+    FIELDS = DeviceState.FIELDS + (
+        ("wind", 0), ("rain_state", False), ("temperature", 0),
+        ("illumination", 0), ("s1", 0), ("s2", 0), ("s3", 0),
+    )
+    __slots__ = ("wind", "rain_state", "temperature", "illumination", "s1", "s2", "s3")
+
+
+class SmokeState(DeviceState):
+    FIELDS = DeviceState.FIELDS + (("smoke", False), ("temperature", 0))
+    __slots__ = ("smoke", "temperature")
+
+
+def record_fingerprint(raw: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    """Parts of a GetStates record the bridge uses, compared directly (no serialization)"""
+    return raw.get('data'), raw.get('adr'), raw.get('state')
+
+
+class DeviceRecord:
+    """Compact per-device record, classified once when first seen"""
+
+    __slots__ = ("sid", "address", "device_type", "kind", "handler", "state", "topic", "uid")
+
+    def __init__(self, sid: str, device_type: str, address: str = '', topic_prefix: str = 'eltako', uid_prefix: str = ''):
+        self.sid = sid
+        self.address = address
+        # State topic base and unique id part, namespaced per gateway if there are several
+        self.topic = f"{topic_prefix}/{sid}"
+        self.uid = f"{uid_prefix}{sid}"
+        self.device_type = device_type
+        self.kind = classify_device_type(device_type)
+        self.handler = get_device_handler(self.kind)
+        self.state = self.handler.state_class()
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any], topic_prefix: str = 'eltako', uid_prefix: str = '') -> 'DeviceRecord':
+        record = cls(raw.get('sid'), raw.get('data', ''), raw.get('adr', ''), topic_prefix, uid_prefix)
+        record.update(raw)
+        return record
+
+    def update(self, raw: Dict[str, Any]) -> Tuple[str, ...]:
+        """Update address and state in place from a GetStates record, return the changed fields"""
+        self.address = raw.get('adr', '')
+        return self.state.update(raw.get('state') or {})
+
+    def __repr__(self) -> str:
+        return f"DeviceRecord(sid={self.sid!r}, type={self.device_type!r}, kind={self.kind.value}, state={self.state!r})"
+
+
+class DeviceHandler:
+    """Behaviour of one device kind
+    
+    Builds gateway commands, applies optimistic command results and renders
+    state topics and Home Assistant discovery configs. Further Eltako
+    device kinds are supported by registering another handler.
+    """
+
+    kind = DeviceKind.UNKNOWN
+    state_class = DeviceState
+
+    def build_command(self, device: DeviceRecord, command: str) -> Optional[str]:
+        """Gateway command data (e.g. 'dimTo50') for an MQTT command, None if unsupported"""
+        logger.warning(f"Unknown device type {device.device_type} for command.")
+        return None
+
+    def apply_command(self, device: DeviceRecord, command: str) -> Optional[Dict[str, Any]]:
+        """Apply the optimistic result of a sent command to the device state
+        
+        Returns the expected state fields, or None if the state is left to
+        the next poll.
+        """
+        return None
+
+    def state_values(self, device: DeviceRecord) -> List[Tuple[str, Any]]:
+        """(subtopic, value) pairs published below eltako/<sid>/"""
+        return []
+
+    def discovery_configs(self, device: DeviceRecord, device_info: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        """(topic, config) pairs for Home Assistant MQTT discovery"""
+        return []
+
+    def describe_feedback(self, device: DeviceRecord) -> Optional[str]:
+        """Short hardware feedback description for debug logging"""
+        return None
+
+
+class BlindHandler(DeviceHandler):
+    kind = DeviceKind.BLIND
+    state_class = BlindState
+
+    def build_command(self, device: DeviceRecord, command: str) -> Optional[str]:
+        c = command.upper()
+        # Check for position commands (numeric 0-100)
+        if is_numeric(command):
+            try:
+                position = int(float(command))
+                if 0 <= position <= 100:
+                    # Always invert position for Eltako device compatibility
+                    inverted_position = 100 - position
+                    return f"moveTo{inverted_position}"
+                logger.warning(f"Blind position out of range: {position}")
+                return None
+            except Exception:
+                logger.warning(f"Invalid blind position command: {command}")
+                return None
+        # Check for standard commands
+        if c in ['OPEN', 'UP']:
+            return 'moveup'
+        if c in ['CLOSE', 'DOWN']:
+            return 'movedown'
+        if c == 'STOP':
+            return 'stop'
+        return None
+
+    def apply_command(self, device: DeviceRecord, command: str) -> Optional[Dict[str, Any]]:
+        # For blinds: DO NOT update state immediately!
+        # Wait for the actual hardware state to be polled and reported.
+        # This prevents the UI from jumping to the inverted position.
+        logger.debug("Blind command sent for %s, waiting for hardware feedback...", device.sid,
+                     extra=log_extra(device.sid, "command", kind=device.kind.value))
+        return None
+
+    def state_values(self, device: DeviceRecord) -> List[Tuple[str, Any]]:
+        state = device.state
+        return [
+            ("state", state.pos),
+            ("sync", state.sync),
+            ("rv", state.rv),
+            ("rt", state.rt),
+        ]
+
+    def discovery_configs(self, device: DeviceRecord, device_info: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        uid = device.uid
+        config = {
+            "name": f"Eltako Blind {uid}",
+            "unique_id": f"eltako_blind_{uid}",
+            "device_class": "blind",
+            "command_topic": f"{device.topic}/set",
+            "position_topic": f"{device.topic}/state",
+            "set_position_topic": f"{device.topic}/set",
+            "set_position_template": "{{ position }}",
+            "position_closed": 100,
+            "position_open": 0,
+            "payload_open": "open",
+            "payload_close": "close",
+            "payload_stop": "stop",
+            "device": device_info
+        }
+        return [(f"homeassistant/cover/eltako_blind_{uid}/config", config)]
+
+    def describe_feedback(self, device: DeviceRecord) -> Optional[str]:
+        return f"position={device.state.pos}%"
+
+
+class SwitchHandler(DeviceHandler):
+    kind = DeviceKind.SWITCH
+    state_class = SwitchState
+
+    def build_command(self, device: DeviceRecord, command: str) -> Optional[str]:
+        c = command.lower()
+        if c in ['on', 'off', 'toggle']:
+            return c
+        return None
+
+    def apply_command(self, device: DeviceRecord, command: str) -> Optional[Dict[str, Any]]:
+        cmd_lower = command.strip().lower()
+        if cmd_lower in ['on', 'off']:
+            device.state.state = cmd_lower
+        elif cmd_lower == 'toggle':
+            device.state.state = 'off' if device.state.state == 'on' else 'on'
+        return {'state': device.state.state}
+
+    def state_values(self, device: DeviceRecord) -> List[Tuple[str, Any]]:
+        return [("state", device.state.state)]
+
+    def discovery_configs(self, device: DeviceRecord, device_info: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        uid = device.uid
+        config = {
+            "name": f"Eltako Switch {uid}",
+            "unique_id": f"eltako_switch_{uid}",
+            "command_topic": f"{device.topic}/set",
+            "state_topic": f"{device.topic}/state",
+            "payload_on": "on",
+            "payload_off": "off",
+            "device": device_info
+        }
+        return [(f"homeassistant/switch/eltako_switch_{uid}/config", config)]
+
+    def describe_feedback(self, device: DeviceRecord) -> Optional[str]:
+        return f"state={device.state.state}"
+
+
+class DimmerHandler(DeviceHandler):
+    kind = DeviceKind.DIMMER
+    state_class = DimmerState
+
+    def build_command(self, device: DeviceRecord, command: str) -> Optional[str]:
+        cmd_lower = command.strip().lower()
+        if cmd_lower in ("on", "off"):
+            return cmd_lower
+        try:
+            val = float(command)
+        except Exception:
+            logger.warning(f"Invalid dimmer numeric command: {command}")
+            return None
+        level = dimmer_level(val)
+        if level is None:
+            logger.warning(f"Dimmer value out of range: {val}")
+            return None
+        return "off" if level == 0 else f"dimTo{level}"
+
+    def apply_command(self, device: DeviceRecord, command: str) -> Optional[Dict[str, Any]]:
+        state = device.state
+        cmd_lower = command.strip().lower()
+        if cmd_lower == 'on':
+            state.state = 'on'
+            if state.level == 0:
+                state.level = 100
+            # The dimmer restores its last level, only the state is known
+            return {'state': 'on'}
+        if cmd_lower == 'off':
+            state.state = 'off'
+            state.level = 0
+        else:
+            try:
+                level = dimmer_level(float(command))
+            except ValueError:
+                return None
+            if level is None:
+                return None
+            state.level = level
+            state.state = 'on' if level > 0 else 'off'
+        return {'state': state.state, 'level': state.level}
+
+    def state_values(self, device: DeviceRecord) -> List[Tuple[str, Any]]:
+        state = device.state
+        return [
+            ("state", state.state),
+            ("brightness", level_to_brightness(state.level)),
+        ]
+
+    def discovery_configs(self, device: DeviceRecord, device_info: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        uid = device.uid
+        config = {
+            "name": f"Eltako Dimmer {uid}",
+            "unique_id": f"eltako_dimmer_{uid}",
+            "command_topic": f"{device.topic}/set",
+            "state_topic": f"{device.topic}/state",
+            "brightness_command_topic": f"{device.topic}/set",
+            "brightness_state_topic": f"{device.topic}/brightness",
+            "brightness_scale": 255,
+            "payload_on": "on",
+            "payload_off": "off",
+            "device": device_info
+        }
+        return [(f"homeassistant/light/eltako_dimmer_{uid}/config", config)]
+
+    def describe_feedback(self, device: DeviceRecord) -> Optional[str]:
+        return f"state={device.state.state}, level={device.state.level}%"
+
+
+class WeatherHandler(DeviceHandler):
+    kind = DeviceKind.WEATHER
+    state_class = WeatherState
+
+    # (key, name, unit, device_class, platform)
+    SENSORS = (
+        ("wind", "Wind", "m/s", None, "sensor"),
+        ("rain", "Rain", None, None, "sensor"),
+        ("temperature", "Temperature", "°C", "temperature", "sensor"),
+        ("illumination", "Illumination", "lx", "illuminance", "sensor"),
+        ("illumination_east", "Illumination East", "lx", "illuminance", "sensor"),
+        ("illumination_south", "Illumination South", "lx", "illuminance", "sensor"),
+        ("illumination_west", "Illumination West", "lx", "illuminance", "sensor"),
+    )
+
+    @staticmethod
+    def _round(value: Any, factor: float = 1) -> int:
+        try:
+            return int(round(float(value) * factor))
+        except Exception:
+            return 0
+
+    def state_values(self, device: DeviceRecord) -> List[Tuple[str, Any]]:
+        state = device.state
+        return [
+            ("wind", state.wind),
+            ("rain", str(state.rain_state).lower()),
+            ("temperature", state.temperature),
+            # zentrale Illumination: nur runden auf int
+            ("illumination", self._round(state.illumination)),
+            # S1/S2/S3: erst mit 1000 multiplizieren, dann runden
+            ("illumination_east", self._round(state.s1, 1000)),
+            ("illumination_south", self._round(state.s2, 1000)),
+            ("illumination_west", self._round(state.s3, 1000)),
+        ]
+
+    def discovery_configs(self, device: DeviceRecord, device_info: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        uid = device.uid
+        configs = []
+        for key, name, unit, devclass, platform in self.SENSORS:
+            config = {
+                "name": name,
+                "unique_id": f"eltako_weather_{key}_{uid}",
+                "state_topic": f"{device.topic}/{key}",
+                "device": device_info
+            }
+            if unit:
+                config["unit_of_measurement"] = unit
+            if devclass:
+                config["device_class"] = devclass
+            if key == "rain":
+                config["icon"] = "mdi:weather-pouring"
+            if "wind" in key:
+                config["icon"] = "mdi:weather-windy"
+            configs.append((f"homeassistant/{platform}/eltako_weather_{key}_{uid}/config", config))
+        return configs
+
+    def describe_feedback(self, device: DeviceRecord) -> Optional[str]:
+        state = device.state
+        return f"temp={state.temperature}°C, rain={state.rain_state}, wind={state.wind}m/s"
+
+
+class SmokeHandler(DeviceHandler):
+    kind = DeviceKind.SMOKE
+    state_class = SmokeState
+
+    def state_values(self, device: DeviceRecord) -> List[Tuple[str, Any]]:
+        state = device.state
+        return [
+            ("smoke", str(state.smoke).lower()),
+            ("temperature", state.temperature),
+        ]
+
+    def discovery_configs(self, device: DeviceRecord, device_info: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        uid = device.uid
+        # Binary Sensor for smoke detection
+        smoke_config = {
+            "name": f"Smoke Detector {uid}",
+            "unique_id": f"eltako_smoke_{uid}",
+            "state_topic": f"{device.topic}/smoke",
+            "device_class": "smoke",
+            "payload_on": "true",
+            "payload_off": "false",
+            "device": device_info
+        }
+        # Temperature Sensor
+        temp_config = {
+            "name": f"Temperature {uid}",
+            "unique_id": f"eltako_smoke_temp_{uid}",
+            "state_topic": f"{device.topic}/temperature",
+            "device_class": "temperature",
+            "unit_of_measurement": "°C",
+            "device": device_info
+        }
+        return [
+            (f"homeassistant/binary_sensor/eltako_smoke_{uid}/config", smoke_config),
+            (f"homeassistant/sensor/eltako_smoke_temp_{uid}/config", temp_config),
+        ]
+
+
+# Discovery topic keys and the template that reads the value from the JSON state
+JSON_STATE_TEMPLATES = {
+    "state_topic": "value_template",
+    "position_topic": "position_template",
+}
+# Platforms whose template options differ from the defaults
+JSON_STATE_PLATFORM_TEMPLATES = {
+    "light": {"state_topic": "state_value_template", "brightness_state_topic": "brightness_value_template"},
+}
+
+
+def json_state_configs(configs: List[Tuple[str, Dict[str, Any]]], base: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Point discovery configs at the single JSON state topic of a device
+
+    Each `<base>/<key>` state topic becomes `<base>/state` with a template
+    reading `key` (the template option depends on the platform in the
+    discovery topic); the first entity also gets the whole document as
+    attributes.
+    """
+    state_topic = f"{base}/state"
+    converted = []
+    for index, (topic, config) in enumerate(configs):
+        config = dict(config)
+        # homeassistant/<platform>/<object_id>/config
+        templates = JSON_STATE_PLATFORM_TEMPLATES.get(topic.split("/")[1], JSON_STATE_TEMPLATES)
+        for topic_key, template_key in templates.items():
+            source = config.get(topic_key)
+            if source and source.startswith(f"{base}/"):
+                config[topic_key] = state_topic
+                config[template_key] = f"{{{{ value_json.{source[len(base) + 1:]} }}}}"
+        if index == 0:
+            config["json_attributes_topic"] = state_topic
+        converted.append((topic, config))
+    return converted
+
+
+DEVICE_HANDLERS: Dict[DeviceKind, DeviceHandler] = {}
+
+
+def register_device_handler(handler: DeviceHandler):
+    """Register the handler for its device kind (replaces an existing one)"""
+    DEVICE_HANDLERS[handler.kind] = handler
+
+
+def get_device_handler(kind: DeviceKind) -> DeviceHandler:
+    return DEVICE_HANDLERS.get(kind) or DEVICE_HANDLERS[DeviceKind.UNKNOWN]
+
+
+for _handler in (DeviceHandler(), BlindHandler(), SwitchHandler(), DimmerHandler(), WeatherHandler(), SmokeHandler()):
+    register_device_handler(_handler)
+
+
+class EltakoGateway:
+    """One MiniSafe2 with its own HTTP pool, poll scheduler, command queue and devices
+
+    Settings from the `eltako` section apply to every gateway unless the
+    gateway entry overrides them. With several gateways topics and unique
+    ids are namespaced: `eltako/<name>/<sid>` instead of `eltako/<sid>`.
+    """
+
+    def __init__(self, name: str, gateway_config: Dict[str, Any], config: Dict[str, Any],
+                 command_handler: Callable[['EltakoGateway', str, str, bool], Awaitable[bool]],
+                 namespaced: bool = False):
+        self.name = name
+        eltako_config = {**(config.get('eltako') or {}), **gateway_config}
+        self.host = eltako_config['host']
+        self.topic_prefix = f"eltako/{name}" if namespaced else "eltako"
+        self.uid_prefix = f"{name}_" if namespaced else ""
+        self.via_device = f"eltako_minisafe2_{name}" if namespaced else "eltako_minisafe2"
+        self.availability_topic = f"eltako/bridge/{name}/availability"
+        self.base_url = f"http://{self.host}/command"
+        self.password = eltako_config['password']
+        # Query parts are built once instead of per request
+        self._auth_query = f"XC_PASS={quote_plus(self.password)}"
+        self._getstates_url = URL(f"{self.base_url}?XC_FNC=GetStates&{self._auth_query}", encoded=True)
+        self._sendsc_url = f"{self.base_url}?XC_FNC=SendSC&type=ENOCEAN"
+        # Keep-alive connection pool towards the gateway
+        self.http_config = config.get('http') or {}
+        self.pool_stats = GatewayPoolStats()
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Gateway latency (until response headers) and errors per XC_FNC
+        self.gateway_latency = {fnc: Histogram(Histogram.LATENCY_BUCKETS) for fnc in ("GetStates", "SendSC")}
+        self.gateway_errors = {fnc: 0 for fnc in ("GetStates", "SendSC")}
+        self.poll_cycle = Histogram(Histogram.LATENCY_BUCKETS)
+        # Circuit breaker around GetStates/SendSC; failed commands are retried
+        # with jittered backoff until command_deadline seconds after sending
+        retry_config = config.get('retry') or {}
+        self.breaker = CircuitBreaker(
+            failure_threshold=retry_config.get('failure_threshold', 3),
+            reset_timeout=retry_config.get('reset_timeout', 5),
+            max_reset_timeout=retry_config.get('max_reset_timeout', 300)
+        )
+        self.command_deadline = retry_config.get('command_deadline', 30)
+        self.command_retries = 0
+        self.commands_expired = 0
+        self.poll_interval = eltako_config.get('poll_interval', 5)
+        # 'stream' parses GetStates records while the body arrives, 'buffered'
+        # reads the whole body first (uses orjson if installed)
+        self.response_parser = eltako_config.get('response_parser', 'stream')
+        self.parse_stats = ParseStats(self.response_parser)
+        self._fetch_latency: Optional[float] = 0.0
+        # Cumulative seconds per poll phase; cycles above slow_cycle log a breakdown
+        profiling_config = config.get('profiling') or {}
+        self.slow_cycle = profiling_config.get('slow_cycle', 2.0)
+        self.poll_phases: Dict[str, float] = {}
+        self.slow_cycles = 0
+        # Set by the bridge when traffic capture is enabled
+        self.capture: Optional[TrafficCapture] = None
+        # Command timeout: poll_interval + 60 seconds
+        self.command_timeout = self.poll_interval + 60
+        logger.info(f"Command timeout set to {self.command_timeout} seconds (poll_interval {self.poll_interval} + 60)")
+        self.devices: Dict[str, DeviceRecord] = {}
+
+        # Fast polling after commands/state changes, backing off to poll_interval
+        polling_config = config.get('polling') or {}
+        # Delta mode: records identical to the previous poll skip the update pipeline.
+        # The MiniSafe2 has no incremental API, type, address and state dict of the
+        # last record per SID are the fingerprint.
+        self.delta = polling_config.get('delta', True)
+        self.fingerprints: Dict[str, Tuple[Any, Any, Any]] = {}
+        self.records_skipped = 0
+        self.records_processed = 0
+        self.poll_scheduler = PollScheduler(
+            idle_interval=self.poll_interval,
+            fast_interval=polling_config.get('fast_interval', 1),
+            fast_window=polling_config.get('fast_window', 15),
+            backoff=polling_config.get('backoff', 2.0)
+        )
+
+        # Commands are coalesced per SID and rate limited towards the gateway
+        commands_config = config.get('commands') or {}
+        self.command_queue = CommandQueue(
+            functools.partial(command_handler, self),
+            max_in_flight=commands_config.get('max_in_flight', 2),
+            min_spacing=commands_config.get('min_spacing', 0.1)
+        )
+        # Per-SID command state, kept for feedback logging until the command timeout
+        self.command_tracker = CommandTracker(
+            confirm_timeout=commands_config.get('confirm_timeout', 15),
+            retention=self.command_timeout
+        )
+
+    def build_command_url(self, device: DeviceRecord, command: str) -> Optional[str]:
+        if not device.device_type or not device.address:
+            return None
+        cmd = device.handler.build_command(device, command)
+        if cmd is None:
+            return None
+        return self._build_url(device.address, cmd)
+
+    def _build_url(self, address: str, cmd_data: str) -> str:
+        return f"{self._sendsc_url}&address={address}&data={cmd_data}&{self._auth_query}"
+
+    def update_device(self, sid: str, raw: Dict[str, Any]) -> Tuple[DeviceRecord, Optional[Tuple[str, ...]]]:
+        """Update (or create and classify) the record of a polled device in place
+
+        Returns the record and its changed state fields (None for a new record).
+        """
+        device = self.devices.get(sid)
+        if device is None or device.device_type != raw.get('data', ''):
+            device = DeviceRecord.from_raw(raw, self.topic_prefix, self.uid_prefix)
+            self.devices[sid] = device
+            return device, None
+        return device, device.update(raw)
+
+    async def iter_device_states(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the device records of a GetStates response
+
+        Raises GatewayError (or aiohttp errors) if the gateway can't be read
+        or the circuit breaker is open.
+        """
+        if not self.breaker.allow():
+            raise GatewayError(f"circuit open, retry in {self.breaker.retry_after():.0f}s")
+        capture = self.capture
+        captured: List[Dict[str, Any]] = []
+        start = time.monotonic()
+        try:
+            async with aclosing(self._read_device_states()) as records:
+                async for record in records:
+                    if capture is not None:
+                        captured.append(record)
+                    yield record
+        except Exception as e:
+            self.gateway_errors["GetStates"] += 1
+            self.breaker.record_failure()
+            if capture is not None:
+                capture.record("getstates", gateway=self.name, elapsed=round(time.monotonic() - start, 4),
+                               error=str(e) or type(e).__name__)
+            raise
+        self.breaker.record_success()
+        if capture is not None:
+            capture.record_states(self.name, round(time.monotonic() - start, 4), captured)
+
+    async def _read_device_states(self) -> AsyncIterator[Dict[str, Any]]:
+        start = time.monotonic()
+        async with self.session.get(self._getstates_url) as response:
+            self._fetch_latency = time.monotonic() - start
+            self.gateway_latency["GetStates"].observe(self._fetch_latency)
+            if response.status != 200:
+                raise GatewayError(f"HTTP error {response.status}")
+            if self.response_parser == 'buffered':
+                body = await response.read()
+                parse_start = time.perf_counter()
+                records = parse_getstates_body(body)
+                self.parse_stats.record(len(body), len(records), len(body), time.perf_counter() - parse_start)
+                for record in records:
+                    yield record
+                return
+            parser = GetStatesParser()
+            async for chunk in response.content.iter_chunked(16384):
+                for record in parser.feed(chunk):
+                    yield record
+            for record in parser.feed(b"", final=True):
+                yield record
+            self.parse_stats.record(parser.bytes, parser.records, parser.peak_buffer, parser.parse_time)
+
+    async def fetch_device_states(self) -> Optional[List[Dict[str, Any]]]:
+        start = time.perf_counter()
+        try:
+            async with aclosing(self.iter_device_states()) as records:
+                devices = [record async for record in records]
+        except Exception as e:
+            logger.error(f"Error fetching device states from {self.name}: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        if self.slow_cycle and elapsed > self.slow_cycle:
+            logger.warning(f"Slow GetStates ({self.name}): {elapsed:.3f}s - headers={self._fetch_latency:.3f}s "
+                           f"parse={self.parse_stats.last_parse_time:.3f}s ({len(devices)} records)")
+        return devices
+
+    def record_poll_phases(self, timer: PhaseTimer, records: int, skipped: int):
+        for phase, seconds in timer.phases.items():
+            self.poll_phases[phase] = self.poll_phases.get(phase, 0.0) + seconds
+        if self.slow_cycle and timer.total > self.slow_cycle:
+            self.slow_cycles += 1
+            logger.warning(f"Slow poll cycle ({self.name}): {timer.total:.3f}s - {timer.breakdown()} "
+                           f"({records} records, {skipped} skipped)")
+
+    def create_session(self) -> aiohttp.ClientSession:
+        """HTTP session for the gateway with keep-alive pool and split timeouts"""
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.http_config.get('limit_per_host', 4),
+            keepalive_timeout=self.http_config.get('keepalive_timeout', 60),
+            ttl_dns_cache=300
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=self.http_config.get('total_timeout', 15),
+            connect=self.http_config.get('connect_timeout', 3),
+            sock_read=self.http_config.get('read_timeout', 10)
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self.pool_stats.trace_config()]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "devices": len(self.devices),
+            "polling": self.poll_scheduler.stats(),
+            "delta": {
+                "enabled": self.delta,
+                "skipped": self.records_skipped,
+                "processed": self.records_processed,
+            },
+            "parser": self.parse_stats.stats(),
+            "http": self.pool_stats.stats(),
+            "commands": self.command_queue.stats(),
+            "tracker": self.command_tracker.stats(),
+            "breaker": self.breaker.stats(),
+            "poll_phases": {phase: round(seconds, 3) for phase, seconds in self.poll_phases.items()},
+            "slow_cycles": self.slow_cycles,
+            "retry": {
+                "retries": self.command_retries,
+                "expired": self.commands_expired,
+            },
+        }
+
+
 class EltakoMiniSafe2Bridge:
     def __init__(self, config_file: str):
         # Load config FIRST
@@ -35,10 +2497,9 @@ class EltakoMiniSafe2Bridge:
         log_level = getattr(logging, log_level_str, logging.INFO)
         
         # Configure logging ONCE with the correct level from config
-        logging.basicConfig(
-            level=log_level,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        self._log_listener = configure_logging(log_level, logging_config)
+        if self._log_listener:
+            atexit.register(self._log_listener.stop)
         
         # Update module-level logger
         global logger
@@ -46,26 +2507,177 @@ class EltakoMiniSafe2Bridge:
         logger.info(f"Logging level set to: {log_level_str}")
         
         self.mqtt_client: Optional[mqtt.Client] = None
-        self.session: Optional[aiohttp.ClientSession] = None
         self.running = False
-        self.devices: Dict[str, Any] = {}
         self.loop: Optional[asyncio.AbstractEventLoop] = None
-        self._last_dim_command_time: Dict[str, float] = {}
+        # Seconds from start until mqtt (commands accepted), inventory, ready
+        # (commands sent) and the first sent command
+        self.startup: Dict[str, float] = {}
+        self._started = time.monotonic()
         self.discovery_count = 0
+        # Serialized discovery payloads per device uid: (signature, [(topic, payload)], digest)
+        self._discovery_cache: Dict[str, Tuple[Tuple[Any, ...], List[Tuple[str, str]], str]] = {}
+        self._discovery_lock = asyncio.Lock()
+        self._discovery_pending = False
+        self._discovery_published = False
+        # Scheduled discovery publish: all devices, or only the queued (new) ones
+        self._discovery_all = False
+        self._discovery_queued: Dict[Tuple[str, str], Tuple[EltakoGateway, DeviceRecord]] = {}
+        self.discovery_runs = 0
+        self.discovery_merged = 0
         self.mqtt_connected = False  # Track MQTT connection state
-        self._recently_commanded_device: Optional[str] = None  # Track last commanded device
+        # Set on the event loop once the broker accepted the connection (CONNACK)
+        self._mqtt_ready = asyncio.Event()
+        # Fire-and-forget tasks (group commands, debounced discovery), referenced until done
+        self._background_tasks: set = set()
 
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
 
-        self.eltako_config = self.config['eltako']
+        # Slow-cycle logging and the on-demand sampling profiler (SIGUSR1 or
+        # a message to eltako/bridge/profile)
+        profiling_config = self.config.get('profiling') or {}
+        self._slow_command = profiling_config.get('slow_command', 2.0)
+        self._profile_duration = profiling_config.get('profile_duration', 30)
+        self.profiler = SamplingProfiler(
+            profiling_config.get('directory', '/data'),
+            profiling_config.get('sample_interval', 0.005)
+        )
+        signal.signal(signal.SIGUSR1, self._profile_signal_handler)
+
         self.mqtt_config = self.config['mqtt']
-        self.base_url = f"http://{self.eltako_config['host']}/command"
-        self.password = self.eltako_config['password']
-        self.poll_interval = self.eltako_config.get('poll_interval', 5)
-        # Command timeout: poll_interval + 60 seconds
-        self._command_timeout = self.poll_interval + 60
-        logger.info(f"Command timeout set to {self._command_timeout} seconds (poll_interval {self.poll_interval} + 60)")
+        # 'asyncio': paho socket driven by the event loop, 'thread': paho's loop_start() thread
+        self.mqtt_loop_mode = self.mqtt_config.get('loop', 'thread')
+        self.mqtt_transport: Optional[AsyncioMQTTTransport] = None
+        self.gateways = self.create_gateways()
+        # Several gateways share the MQTT connection with namespaced topics
+        self.namespaced = len(self.gateways) > 1
+        for gateway in self.gateways.values():
+            gateway.breaker.on_change = functools.partial(self._on_breaker_change, gateway)
+        # eltako/group/<name>/set fans a command out to the group's devices
+        self.groups = self.create_groups()
+        self.group_commands = 0
+        self.group_latency = Histogram(Histogram.LATENCY_BUCKETS)
+        self.mqtt_publishes = 0
+        self.loop_lag = Histogram(Histogram.LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+        # Prometheus metrics endpoint on the add-on port
+        self.metrics_config = self.config.get('metrics') or {}
+        self._metrics_runner: Optional[web.AppRunner] = None
+
+        # Only changed state topics are published; heartbeat_interval (minutes)
+        # forces a periodic republish of unchanged topics
+        self.publish_config = self.config.get('publish') or {}
+        heartbeat_minutes = self.publish_config.get('heartbeat_interval', 0)
+        self.publish_cache = PublishCache(heartbeat_interval=heartbeat_minutes * 60, scopes=tuple(self.gateways))
+        self._stats_interval = self.publish_config.get('stats_interval', 300)
+        # While the broker is unreachable only the latest message per topic is kept
+        self.offline_buffer = OfflineBuffer(self.publish_config.get('offline_buffer_kb', 1024) * 1024)
+        self._replay_batch_size = max(1, self.publish_config.get('replay_batch_size', 100))
+        self._replay_interval = self.publish_config.get('replay_interval', 0.1)
+        self._replay_task: Optional[asyncio.Task] = None
+        # state_format 'json' publishes one document per device to eltako/<sid>/state
+        # instead of a topic per value ('topics', the default)
+        self.json_state = self.publish_config.get('state_format', 'topics') == 'json'
+        self._json_states: Dict[str, Dict[str, Any]] = {}
+        # Deadband/min interval/smoothing per sensor measurement (off unless configured)
+        telemetry_config = dict(self.config.get('telemetry') or {})
+        immediate = tuple(telemetry_config.pop('immediate', None) or ("rain", "smoke"))
+        self.telemetry_filter = TelemetryFilter(telemetry_config, immediate) if telemetry_config else None
+
+        # Discovery is published in paced batches; 'online' bursts are merged
+        discovery_config = self.config.get('discovery') or {}
+        self._discovery_batch_size = max(1, discovery_config.get('batch_size', 50))
+        self._discovery_batch_interval = discovery_config.get('batch_interval', 0.1)
+        self._discovery_debounce = discovery_config.get('debounce', 2)
+        # Hash of the published discovery configs per device uid
+        self._discovery_hashes: Dict[str, str] = {}
+        self._last_stats_log = time.monotonic()
+
+        # Warm start: inventory and published topics survive a restart
+        snapshot_config = self.config.get('snapshot') or {}
+        self.snapshot: Optional[StateSnapshot] = None
+        if snapshot_config.get('enabled', True):
+            self.snapshot = StateSnapshot(snapshot_config.get('path', '/data/eltako2mqtt_snapshot.json'))
+        self._snapshot_interval = snapshot_config.get('interval', 300)
+        # Keep the restored publish cache on the first broker connect
+        self._keep_publish_cache = False
+
+        # Recent state changes per device and field, queried over /history or MQTT (off by default)
+        history_config = self.config.get('history') or {}
+        self.history: Optional[DeviceHistory] = None
+        if history_config.get('enabled', False):
+            self.history = DeviceHistory(history_config.get('hours', 24),
+                                         history_config.get('max_mb', 100) * 1024 * 1024)
+
+        # Gateway responses and MQTT commands recorded for replay.py (off by default)
+        capture_config = self.config.get('capture') or {}
+        self.capture: Optional[TrafficCapture] = None
+        if capture_config.get('enabled', False):
+            self.capture = TrafficCapture(capture_config.get('path', '/data/eltako2mqtt_capture.jsonl'),
+                                          capture_config.get('max_mb', 100) * 1024 * 1024,
+                                          capture_config.get('keyframe_interval', 300))
+            self.capture.record("start", version=TrafficCapture.VERSION, time=time.time(),
+                                gateways=list(self.gateways), config=self._capture_config())
+            for gateway in self.gateways.values():
+                gateway.capture = self.capture
+            logger.info(f"Capturing gateway and command traffic to {self.capture.path}")
+
+    def _capture_config(self) -> Dict[str, Any]:
+        """Settings the captured traffic depends on, without hosts and credentials"""
+        config = {section: self.config[section] for section in TrafficCapture.CONFIG_SECTIONS
+                  if self.config.get(section)}
+        config["gateways"] = [{"name": gateway.name, "poll_interval": gateway.poll_interval,
+                               "response_parser": gateway.response_parser} for gateway in self.gateways.values()]
+        return config
+
+    def create_gateways(self) -> Dict[str, EltakoGateway]:
+        """Gateways from the `gateways` list, or the single `eltako` host"""
+        entries = self.config.get('gateways') or [{}]
+        namespaced = len(entries) > 1
+        gateways: Dict[str, EltakoGateway] = {}
+        for index, entry in enumerate(entries):
+            name = str(entry.get('name') or f"gw{index + 1}")
+            if (name in gateways or name in RESERVED_GATEWAY_NAMES
+                    or not name.replace('_', '').replace('-', '').isalnum()):
+                logger.error(f"Invalid or duplicate gateway name: {name!r}")
+                sys.exit(1)
+            # Entries inherit host and password from the `eltako` section
+            merged = {**(self.config.get('eltako') or {}), **entry}
+            missing = [key for key in ('host', 'password') if not merged.get(key)]
+            if missing:
+                logger.error(f"Gateway {name}: {' and '.join(missing)} not configured "
+                             "(set in its gateways entry or the eltako section)")
+                sys.exit(1)
+            gateways[name] = EltakoGateway(name, entry, self.config, self.handle_device_command, namespaced)
+        return gateways
+
+    def create_groups(self) -> Dict[str, List[Tuple[EltakoGateway, str]]]:
+        """Groups from the `groups` list; members are SIDs, or <gateway>/<sid> with several gateways"""
+        groups: Dict[str, List[Tuple[EltakoGateway, str]]] = {}
+        for entry in self.config.get('groups') or []:
+            name = str(entry.get('name') or '')
+            if name in groups or not name.replace('_', '').replace('-', '').isalnum():
+                logger.error(f"Invalid or duplicate group name: {name!r}")
+                sys.exit(1)
+            members = []
+            for member in entry.get('members') or []:
+                member = str(member)
+                if '/' in member:
+                    gateway_name, sid = member.split('/', 1)
+                    gateway = self.gateways.get(gateway_name)
+                elif not self.namespaced:
+                    gateway, sid = next(iter(self.gateways.values())), member
+                else:
+                    gateway = None
+                if gateway is None:
+                    logger.error(f"Invalid member {member!r} of group {name} (use <gateway>/<sid> with several gateways)")
+                    sys.exit(1)
+                members.append((gateway, sid))
+            groups[name] = members
+        return groups
+
+    def iter_devices(self) -> List[DeviceRecord]:
+        return [device for gateway in self.gateways.values() for device in gateway.devices.values()]
 
     def load_config(self, config_file: str) -> Dict[str, Any]:
         try:
@@ -80,23 +2692,18 @@ class EltakoMiniSafe2Bridge:
         logger.info(f"Received signal {signum}, shutting down...")
         self.running = False
 
-    def is_switch_device(self, device_type: str) -> bool:
-        """Check if device is a switch-type actuator
-        
-        Supports all FSR14 variants and other switch actuators:
-        - FSR14 (1-4 channels)
-        - FSR14M-2x (with power measurement)
-        - FSR14SSR (Solid State Relay)
-        - F4SR14-LED (4-channel for LED)
-        - FAE14LPR, FAE14SSR (switch actuators)
-        """
-        device_type_lower = device_type.lower()
-        return any(keyword in device_type_lower for keyword in [
-            'switch',
-            'fsr14',       # All FSR14 variants
-            'f4sr14',      # 4-channel switch
-            'fae14'        # FAE14 switch actuators
-        ])
+    def _profile_signal_handler(self, signum, frame):
+        self.toggle_profiler()
+
+    def toggle_profiler(self, duration: Optional[float] = None):
+        """Start the sampling profiler, or stop a running one (writes the profile)"""
+        if self.profiler.active:
+            logger.info("Stopping profiler")
+            self.profiler.stop()
+            return
+        duration = duration or self._profile_duration
+        if self.profiler.start(duration):
+            logger.info(f"Profiling the event loop for {duration:.0f}s (sampling every {self.profiler.interval * 1000:.0f} ms)")
 
     async def setup_mqtt(self):
         # Create MQTT client with CallbackAPIVersion.VERSION2 for modern paho-mqtt
@@ -107,6 +2714,8 @@ class EltakoMiniSafe2Bridge:
         self.mqtt_client.on_connect = self.on_mqtt_connect
         self.mqtt_client.on_message = self.on_mqtt_message
         self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+        # The broker marks the bridge (and so all entities) unavailable if it dies
+        self.mqtt_client.will_set(BRIDGE_AVAILABILITY_TOPIC, "offline", retain=True)
 
         if self.mqtt_config.get('username') and self.mqtt_config.get('password'):
             self.mqtt_client.username_pw_set(
@@ -114,13 +2723,25 @@ class EltakoMiniSafe2Bridge:
                 self.mqtt_config['password']
             )
         try:
-            self.mqtt_client.connect(
-                self.mqtt_config['host'],
-                self.mqtt_config.get('port', 1883),
-                60
-            )
-            self.mqtt_client.loop_start()
-            logger.info("MQTT client connected (paho-mqtt 2.1.0 - CallbackAPIVersion.VERSION2)")
+            if self.mqtt_loop_mode == 'asyncio':
+                self.mqtt_transport = AsyncioMQTTTransport(self.loop, self.mqtt_config.get('max_pending', 1000))
+                self.mqtt_transport.attach(self.mqtt_client)
+                await self.mqtt_transport.connect(
+                    self.mqtt_config['host'],
+                    self.mqtt_config.get('port', 1883),
+                    60
+                )
+                self.mqtt_transport.start()
+            else:
+                # connect() blocks on DNS and the TCP handshake
+                await self.loop.run_in_executor(
+                    None, self.mqtt_client.connect,
+                    self.mqtt_config['host'],
+                    self.mqtt_config.get('port', 1883),
+                    60
+                )
+                self.mqtt_client.loop_start()
+            logger.info(f"MQTT client connected (paho-mqtt 2.1.0 - CallbackAPIVersion.VERSION2, {self.mqtt_loop_mode} loop)")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             raise
@@ -140,8 +2761,28 @@ class EltakoMiniSafe2Bridge:
         if reason_code == 0:
             logger.info("Connected to MQTT broker")
             self.mqtt_connected = True  # Set connection flag
-            client.subscribe("eltako/+/set")
+            # Broker may have lost retained messages - republish everything
+            # (except right after a warm start, where the restored cache is kept)
+            if self._keep_publish_cache:
+                self._keep_publish_cache = False
+            else:
+                self.publish_cache.clear()
+            if self.namespaced:
+                # One filter per gateway: eltako/+/+/set would also match the
+                # group topics and deliver each group command twice
+                for name in self.gateways:
+                    client.subscribe(f"eltako/{name}/+/set")
+            else:
+                client.subscribe("eltako/+/set")
             client.subscribe("homeassistant/status")
+            client.subscribe(PROFILE_TOPIC)
+            if self.history is not None:
+                client.subscribe(HISTORY_REQUEST_TOPIC)
+            if self.groups:
+                client.subscribe(f"{GROUP_TOPIC_PREFIX}+/set")
+            self._call_on_loop(self._mqtt_ready.set)
+            self._call_on_loop(self._publish_availability)
+            self._call_on_loop(self._start_offline_replay)
         else:
             logger.error(f"Failed to connect to MQTT broker: {reason_code}")
             self.mqtt_connected = False
@@ -158,32 +2799,57 @@ class EltakoMiniSafe2Bridge:
         """
         topic = msg.topic
         payload = msg.payload.decode()
-        logger.debug(f"Received MQTT message: {topic} = {payload}")
+        logger.debug("Received MQTT message: %s = %s", topic, payload)
         if topic == "homeassistant/status" and payload == "online":
-            if self.loop:
-                asyncio.run_coroutine_threadsafe(self.publish_discovery(), self.loop)
+            self._call_on_loop(self.request_discovery)
+            return
+
+        if topic == PROFILE_TOPIC:
+            # Retained messages would start a profile on every restart
+            if not msg.retain:
+                duration = float(payload) if is_numeric(payload) else None
+                if payload == "stop" and not self.profiler.active:
+                    return
+                self._call_on_loop(self.toggle_profiler, duration)
+            return
+
+        if topic == HISTORY_REQUEST_TOPIC:
+            if self.history is not None and not msg.retain:
+                self._call_on_loop(self.handle_history_request, payload)
+            return
+
+        if self.capture is not None and topic.endswith("/set"):
+            # Lines are collected on the event loop (take() and rotation run there)
+            self._call_on_loop(functools.partial(self.capture.record, "command", topic=topic, payload=payload))
+
+        if topic.startswith(GROUP_TOPIC_PREFIX) and topic.endswith("/set"):
+            name = topic[len(GROUP_TOPIC_PREFIX):-len("/set")]
+            if name in self.groups:
+                self._call_on_loop(self.submit_group_command, name, payload)
             else:
-                logger.error("No event loop set for scheduling publish_discovery")
+                logger.warning("Unknown group in topic: %s", topic)
             return
 
         if topic.startswith("eltako/") and topic.endswith("/set"):
-            sid = topic.split("/")[1]
-            if self.loop:
-                now = time.monotonic()
-                # Sperre 'on' Befehl, wenn innerhalb 1.5 Sekunden zuvor dimToX gesendet wurde
-                if payload.strip().lower() == 'on':
-                    last_dim_time = self._last_dim_command_time.get(sid, 0)
-                    if (now - last_dim_time) < 1.5:
-                        logger.info(f"Ignoring 'on' command for {sid} due to recent dimToX command")
-                        return
-                else:
-                    # Prüfe, ob Payload numerisch (dim-Level oder Position)
-                    if self.is_numeric(payload):
-                        self._last_dim_command_time[sid] = now
-                        # Track this device as recently commanded
-                        self._recently_commanded_device = sid
+            parts = topic.split("/")
+            if self.namespaced:
+                gateway, sid = self.gateways.get(parts[1]), parts[2]
+            else:
+                gateway, sid = next(iter(self.gateways.values())), parts[1]
+            if gateway is None:
+                logger.warning(f"Unknown gateway in topic: {topic}")
+                return
+            self._call_on_loop(self.submit_command, gateway, sid, payload)
 
-                asyncio.run_coroutine_threadsafe(self.handle_device_command(sid, payload), self.loop)
+    def _call_on_loop(self, callback: Callable, *args):
+        """Run an MQTT callback's follow-up on the event loop"""
+        if self.mqtt_transport is not None:
+            # asyncio loop mode: paho callbacks already run on the event loop
+            callback(*args)
+        elif self.loop:
+            self.loop.call_soon_threadsafe(callback, *args)
+        else:
+            logger.error(f"No event loop set for scheduling {getattr(callback, '__name__', callback)}")
 
     def on_mqtt_disconnect(self, client: mqtt.Client, userdata: Any, disconnect_flags: mqtt.DisconnectFlags, reason_code: mqtt.ReasonCode, properties: Any):
         """
@@ -203,460 +2869,886 @@ class EltakoMiniSafe2Bridge:
             logger.warning(f"Unexpected disconnect from MQTT broker: {reason_code}")
         self.mqtt_connected = False  # Clear connection flag
 
-    @staticmethod
-    def is_numeric(value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+    def submit_command(self, gateway: EltakoGateway, sid: str, command: str):
+        """Track and queue a device command (runs on the event loop)"""
+        # Sperre 'on' Befehl, solange zuvor ein dimToX für das Gerät aussteht
+        if gateway.command_tracker.is_redundant(sid, command):
+            logger.info("Ignoring 'on' command for %s due to pending dimToX command", sid,
+                        extra=log_extra(sid, "command", gateway.name))
+            return
+        device = gateway.devices.get(sid)
+        gateway.command_tracker.add(sid, command, device.kind.value if device else DeviceKind.UNKNOWN.value)
+        gateway.command_queue.put(sid, command)
+
+    def _spawn(self, coro: Awaitable[None], name: str) -> asyncio.Task:
+        """Run a coroutine in the background, keeping a reference until it is done"""
+        task = asyncio.create_task(coro, name=name)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+        return task
 
-    async def handle_device_command(self, sid: str, command: str):
-        logger.info(f"Handling command for {sid}: '{command}'")
-        if sid not in self.devices:
-            logger.warning(f"Unknown device SID: {sid}")
+    def _background_task_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task '{task.get_name()}' failed: {task.exception()!r}")
+
+    def submit_group_command(self, name: str, command: str):
+        """Send a command to all devices of a group (runs on the event loop)"""
+        if not self.running:
+            # Not serving yet: queue the members like single commands
+            for gateway, sid in self.groups[name]:
+                self.submit_command(gateway, sid, command)
             return
+        self._spawn(self._run_group_command(name, command), f"group {name}")
+
+    async def _run_group_command(self, name: str, command: str):
+        """Queue the members in send order per gateway, then publish their states together
+
+        Members go through the gateway's command queue, so a group command
+        supersedes pending commands of its members and shares the
+        gateway's in-flight and rate limits.
+        """
+        start = time.monotonic()
+        self.group_commands += 1
+        loop = asyncio.get_running_loop()
+        batches: Dict[str, Tuple[EltakoGateway, List[DeviceRecord]]] = {}
+        for gateway, sid in self.groups[name]:
+            device = gateway.devices.get(sid)
+            if device is None:
+                logger.warning("Unknown device %s in group %s", sid, name, extra=log_extra(sid, "group", gateway.name))
+                continue
+            if gateway.command_tracker.is_redundant(sid, command):
+                continue
+            gateway.command_tracker.add(sid, command, device.kind.value)
+            batches.setdefault(gateway.name, (gateway, []))[1].append(device)
+        queued: List[Tuple[DeviceRecord, asyncio.Future]] = []
+        for gateway, devices in batches.values():
+            # Longest actuation first: blinds start moving while lights are still being sent
+            devices.sort(key=lambda device: GROUP_SEND_ORDER.get(device.kind, len(GROUP_SEND_ORDER)))
+            for device in devices:
+                done = loop.create_future()
+                gateway.command_queue.put(device.sid, command, publish=False, done=done)
+                queued.append((device, done))
+        accepted = await asyncio.gather(*(done for _, done in queued))
+        # Failed members keep their state; superseded ones publish with the newer command
+        sent = [device for (device, _), was_accepted in zip(queued, accepted) if was_accepted]
+        # One burst with a single drain instead of one publish per command
+        for device in sent:
+            await self.publish_device_state(device.sid, device, drain=False)
+        await self.mqtt_drain()
+        elapsed = time.monotonic() - start
+        self.group_latency.observe(elapsed)
+        logger.info("Group %s: '%s' sent to %d of %d devices in %.3fs", name, command, len(sent), len(queued), elapsed)
+
+    async def handle_device_command(self, gateway: EltakoGateway, sid: str, command: str,
+                                    publish: bool = True) -> bool:
+        """Send a command to the gateway, retrying transport failures; True if the gateway accepted it"""
+        extra = log_extra(sid, "command", gateway.name)
+        logger.info("Handling command for %s: '%s'", sid, command, extra=extra)
+        tracker = gateway.command_tracker
+        if sid not in gateway.devices:
+            logger.warning("Unknown device SID: %s", sid, extra=extra)
+            tracker.discard(sid, command)
+            return False
 
-        device = self.devices[sid]
-        url = self.build_command_url(device, command)
+        device = gateway.devices[sid]
+        extra["kind"] = device.kind.value
+        url = gateway.build_command_url(device, command)
         if not url:
-            logger.warning(f"Ignoring unsupported command: {command}")
-            return
+            logger.warning("Ignoring unsupported command: %s", command, extra=extra)
+            tracker.discard(sid, command)
+            return False
+
+        # Retry transport failures with jittered backoff until the deadline,
+        # unless a newer command for the device supersedes this one
+        deadline = time.monotonic() + gateway.command_deadline
+        attempt = 0
+        # Phases: http, publish (optimistic state) and retry_wait
+        timer = PhaseTimer()
+        try:
+            while True:
+                accepted = None
+                if gateway.breaker.allow():
+                    accepted = await self._send_command(gateway, sid, command, device, url, timer, publish)
+                if accepted is not None:
+                    if accepted:
+                        self.startup.setdefault("first_command", time.monotonic() - self._started)
+                    return accepted
+                delay = max(gateway.breaker.retry_after(), backoff_delay(attempt, 0.5, 10))
+                if time.monotonic() + delay > deadline:
+                    logger.error("Giving up command for %s (%s) after %d attempt(s)", sid, command, attempt + 1,
+                                 extra=extra)
+                    gateway.commands_expired += 1
+                    tracker.discard(sid, command)
+                    return False
+                await asyncio.sleep(delay)
+                timer.lap("retry_wait")
+                if gateway.command_queue.has_pending(sid):
+                    logger.info("Dropping retry of superseded command for %s: '%s'", sid, command, extra=extra)
+                    tracker.discard(sid, command)
+                    return False
+                attempt += 1
+                gateway.command_retries += 1
+                logger.info("Retrying command for %s: '%s' (attempt %d)", sid, command, attempt + 1, extra=extra)
+        finally:
+            timer.lap("other")
+            if self._slow_command and timer.total > self._slow_command:
+                logger.warning("Slow command for %s (%s): %.3fs - %s", sid, command, timer.total, timer.breakdown(),
+                               extra=extra)
 
+    async def _send_command(self, gateway: EltakoGateway, sid: str, command: str, device: DeviceRecord, url: str,
+                            timer: PhaseTimer, publish: bool = True) -> Optional[bool]:
+        """Send one SendSC request: True if accepted, False if refused, None if worth retrying"""
+        tracker = gateway.command_tracker
+        extra = log_extra(sid, "command", gateway.name, device.kind.value)
+        capture = self.capture
         try:
-            async with self.session.get(url) as response:
+            start = time.monotonic()
+            async with gateway.session.get(url) as response:
+                gateway.gateway_latency["SendSC"].observe(time.monotonic() - start)
                 text = await response.text()
-                if response.status == 200 and "{XC_SUC}" in text:
-                    logger.info(f"Command successful for {sid}: {command}")
-                    await self.update_device_state_immediate(sid, command, device)
-                else:
-                    logger.error(f"Command failed for {sid} ({command}): {text}")
         except Exception as e:
-            logger.error(f"Error sending command to {sid}: {e}")
-
-    def build_command_url(self, device: Dict[str, Any], command: str) -> Optional[str]:
-        device_type = device.get('data', '')
-        address = device.get('adr', '')
-        if not device_type or not address:
+            timer.lap("http")
+            if capture is not None:
+                capture.record("sendsc", gateway=gateway.name, sid=sid, command=command,
+                               elapsed=round(time.monotonic() - start, 4), error=str(e) or type(e).__name__)
+            logger.error("Error sending command to %s: %s", sid, e, extra=extra)
+            gateway.gateway_errors["SendSC"] += 1
+            gateway.breaker.record_failure()
             return None
-        cmd_lower = command.strip().lower()
-
-        if 'dimmer' in device_type.lower():
-            if cmd_lower == "on":
-                cmd = "on"
-            elif cmd_lower == "off":
-                cmd = "off"
-            else:
-                try:
-                    val = float(command)
-                    if 0 <= val <= 255:
-                        level = round(val * 100 / 255)
-                    elif 0 <= val <= 100:
-                        level = int(val)
-                    else:
-                        logger.warning(f"Dimmer value out of range: {val}")
-                        return None
-                    if level == 0:
-                        cmd = "off"
-                    else:
-                        cmd = f"dimTo{level}"
-                except Exception:
-                    logger.warning(f"Invalid dimmer numeric command: {command}")
-                    return None
-            return self._build_url(address, cmd)
-        elif 'blind' in device_type.lower() or 'tf_blind' in device_type.lower():
-            c = command.upper()
-            # Check for position commands (numeric 0-100)
-            if self.is_numeric(command):
-                try:
-                    position = int(float(command))
-                    if 0 <= position <= 100:
-                        # Always invert position for Eltako device compatibility
-                        inverted_position = 100 - position
-                        cmd = f"moveTo{inverted_position}"
-                    else:
-                        logger.warning(f"Blind position out of range: {position}")
-                        return None
-                except Exception:
-                    logger.warning(f"Invalid blind position command: {command}")
-                    return None
-            # Check for standard commands
-            elif c in ['OPEN', 'UP']:
-                cmd = 'moveup'
-            elif c in ['CLOSE', 'DOWN']:
-                cmd = 'movedown'
-            elif c == 'STOP':
-                cmd = 'stop'
-            else:
-                return None
-            return self._build_url(address, cmd)
-        elif self.is_switch_device(device_type):
-            c = command.lower()
-            if c in ['on', 'off']:
-                cmd = c
-            elif c == 'toggle':
-                cmd = 'toggle'
-            else:
-                return None
-            return self._build_url(address, cmd)
-        else:
-            logger.warning(f"Unknown device type {device_type} for command.")
+        timer.lap("http")
+        if capture is not None:
+            capture.record("sendsc", gateway=gateway.name, sid=sid, command=command,
+                           elapsed=round(time.monotonic() - start, 4), status=response.status, response=text)
+        # Poll fast to pick up the hardware feedback quickly
+        gateway.poll_scheduler.notify_activity()
+        if response.status >= 500:
+            logger.error("Command failed for %s (%s): HTTP error %s", sid, command, response.status, extra=extra)
+            gateway.gateway_errors["SendSC"] += 1
+            gateway.breaker.record_failure()
             return None
+        gateway.breaker.record_success()
+        if response.status == 200 and "{XC_SUC}" in text:
+            logger.info("Command successful for %s: %s", sid, command, extra=extra)
+            baseline = device.state.as_dict()
+            expected = await self.update_device_state_immediate(sid, command, device, publish)
+            tracker.mark_sent(sid, command, baseline, expected)
+            timer.lap("publish")
+            return True
+        # The gateway answered but refused the command - not retried
+        logger.error("Command failed for %s (%s): %s", sid, command, text, extra=extra)
+        gateway.gateway_errors["SendSC"] += 1
+        tracker.discard(sid, command)
+        return False
 
-    def _build_url(self, address: str, cmd_data: str) -> str:
-        return f"{self.base_url}?XC_FNC=SendSC&type=ENOCEAN&address={address}&data={cmd_data}&XC_PASS={quote_plus(self.password)}"
+    async def update_device_state_immediate(self, sid: str, command: str, device: DeviceRecord,
+                                            publish: bool = True) -> Optional[Dict[str, Any]]:
+        """Publish the optimistic state for a sent command
+        
+        Returns the expected state fields a poll has to report to confirm
+        the command, or None if no optimistic state was applied. Group
+        commands pass publish=False and publish all members afterwards.
+        """
+        expected = device.handler.apply_command(device, command)
+        if expected is not None and publish:
+            await self.publish_device_state(sid, device)
+        return expected
 
-    async def update_device_state_immediate(self, sid: str, command: str, device: Dict[str, Any]):
-        if sid not in self.devices:
+    def _log_device_feedback(self, gateway: EltakoGateway, sid: str, device: DeviceRecord):
+        """Log device state feedback for debugging (only if MQTT is connected and device was recently commanded)"""
+        if not self.mqtt_connected:
+            return
+        
+        # Only log if device was recently commanded (and DEBUG is on for it)
+        if not gateway.command_tracker.is_recent(sid) or not logger.isEnabledFor(logging.DEBUG):
             return
+        
+        feedback = device.handler.describe_feedback(device)
+        if feedback:
+            logger.debug("Hardware feedback for %s %s: %s", device.kind.value, sid, feedback,
+                         extra=log_extra(sid, "poll", gateway.name, device.kind.value))
 
-        device_type = device.get('data', '')
-        cmd_lower = command.strip().lower()
-        val_numeric = None
+    def _mqtt_publish(self, topic: str, payload: Any, retain: bool = True):
+        if not self.mqtt_connected:
+            # Don't let paho queue every intermediate state while offline
+            self.offline_buffer.put(topic, payload, retain)
+            return
+        if self.offline_buffer:
+            self.offline_buffer.discard(topic)
+        self.mqtt_publishes += 1
+        self.mqtt_client.publish(topic, payload, retain=retain)
+        if self.mqtt_transport is not None:
+            self.mqtt_transport.queued()
 
-        try:
-            val_numeric = float(command)
-            is_numeric = True
-        except Exception:
-            is_numeric = False
-
-        if 'dimmer' in device_type.lower():
-            if cmd_lower == 'on':
-                device['state']['state'] = 'on'
-                if device['state'].get('level', 0) == 0:
-                    device['state']['level'] = 100
-            elif cmd_lower == 'off':
-                device['state']['state'] = 'off'
-                device['state']['level'] = 0
-            elif is_numeric:
-                if 0 <= val_numeric <= 255:
-                    level = round(val_numeric * 100 / 255)
-                elif 0 <= val_numeric <= 100:
-                    level = int(val_numeric)
-                else:
-                    return
-                device['state']['level'] = level
-                device['state']['state'] = 'on' if level > 0 else 'off'
-            await self.publish_device_state(sid, device)
-        elif self.is_switch_device(device_type):
-            if cmd_lower in ['on', 'off']:
-                device['state']['state'] = cmd_lower
-            elif cmd_lower == 'toggle':
-                current = device['state'].get('state', 'off')
-                device['state']['state'] = 'off' if current == 'on' else 'on'
-            await self.publish_device_state(sid, device)
-        elif 'blind' in device_type.lower() or 'tf_blind' in device_type.lower():
-            # For blinds: DO NOT update state immediately!
-            # Wait for the actual hardware state to be polled and reported.
-            # This prevents the UI from jumping to the inverted position.
-            logger.debug(f"Blind command sent for {sid}, waiting for hardware feedback...")
+    def _publish_availability(self):
+        """Retained online/offline of the bridge and of each gateway (breaker state)
+
+        The bridge stays offline until the device inventory is loaded.
+        """
+        self._mqtt_publish(BRIDGE_AVAILABILITY_TOPIC, "online" if self.running else "offline")
+        for gateway in self.gateways.values():
+            self._mqtt_publish(gateway.availability_topic, "online" if gateway.breaker.available else "offline")
+
+    def _on_breaker_change(self, gateway: EltakoGateway, state: BreakerState):
+        if state is BreakerState.OPEN:
+            logger.warning(f"Gateway {gateway.name} unreachable, circuit open "
+                           f"(retry in {gateway.breaker.retry_after():.1f}s)")
+        else:
+            logger.info(f"Gateway {gateway.name} reachable again, circuit closed")
+        self._mqtt_publish(gateway.availability_topic, "online" if gateway.breaker.available else "offline")
+
+    def _start_offline_replay(self):
+        if self.offline_buffer and (self._replay_task is None or self._replay_task.done()):
+            self._replay_task = asyncio.ensure_future(self._replay_offline_buffer())
+
+    async def _replay_offline_buffer(self):
+        """Publish the messages buffered while offline in paced batches"""
+        logger.info(f"Replaying {len(self.offline_buffer)} buffered MQTT messages")
+        while self.offline_buffer and self.mqtt_connected:
+            for topic, payload, retain in self.offline_buffer.pop_batch(self._replay_batch_size):
+                self._mqtt_publish(topic, payload, retain)
+                if not topic.startswith("homeassistant/"):
+                    # The full publish after the reconnect doesn't need to repeat it
+                    self.publish_cache.remember(topic, payload)
+            await self.mqtt_drain()
+            await asyncio.sleep(self._replay_interval)
+
+    async def mqtt_drain(self):
+        """Backpressure point for bulk publishers (no-op in thread mode)"""
+        if self.mqtt_transport is not None:
+            await self.mqtt_transport.drain()
+
+    def _publish_state(self, topic: str, value: Any, measurement: Optional[str] = None):
+        """Publish a retained state topic, skipping unchanged payloads
+
+        Values of a `measurement` pass the telemetry filter first.
+        """
+        if measurement is not None and self.telemetry_filter is not None:
+            value = self.telemetry_filter.apply(topic, measurement, value)
+        payload = encode_payload(value)
+        if self.publish_cache.should_publish(topic, payload):
+            self._mqtt_publish(topic, payload)
+
+    def _publish_json_state(self, base: str, document: Dict[str, Any]):
+        """Publish the retained JSON state document of a device, skipping unchanged ones"""
+        self._json_states[base] = document
+        self._publish_state(f"{base}/state", json.dumps(document, separators=(',', ':')))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Collect runtime counters of the bridge components"""
+        return {
+            "devices": sum(len(gateway.devices) for gateway in self.gateways.values()),
+            "publish": self.publish_cache.stats(),
+            "offline_buffer": self.offline_buffer.stats(),
+            "telemetry": self.telemetry_filter.stats() if self.telemetry_filter else None,
+            "discovery": {
+                "runs": self.discovery_runs,
+                "merged_requests": self.discovery_merged,
+                "cached_devices": len(self._discovery_cache),
+                "configs_last": self.discovery_count,
+            },
+            "mqtt": self.mqtt_transport.stats() if self.mqtt_transport else {"loop": "thread"},
+            "gateways": {name: gateway.stats() for name, gateway in self.gateways.items()},
+            "snapshot": self.snapshot.stats() if self.snapshot else None,
+            "capture": self.capture.stats() if self.capture else None,
+            "history": self.history.stats() if self.history else None,
+            "startup": {phase: round(seconds, 3) for phase, seconds in self.startup.items()},
+            "groups": {
+                "configured": len(self.groups),
+                "commands": self.group_commands,
+                "latency": self.group_latency.stats(),
+            },
+        }
+
+    def _maybe_log_statistics(self):
+        if not self._stats_interval:
+            return
+        now = time.monotonic()
+        if (now - self._last_stats_log) < self._stats_interval:
             return
+        self._last_stats_log = now
+        logger.info(f"Statistics: {json.dumps(self.get_statistics())}")
 
-    def eltako_level_to_mqtt_brightness(self, level: int) -> int:
-        """Convert 0-100 to 0-255 brightness"""
-        # Validiere Input
-        if level is None or (isinstance(level, str) and not level.isdigit()):
-            logger.warning(f"Invalid brightness level: {level}, using 0")
-            level = 0
-        
-        # Konvertiere sicher
+    def render_metrics(self) -> str:
+        """Render the bridge counters in the Prometheus text format"""
+        writer = MetricsWriter()
+        gateways = list(self.gateways.values())
+        kinds = []
+        for gateway in gateways:
+            counts = {kind.value: 0 for kind in DeviceKind}
+            for device in gateway.devices.values():
+                counts[device.kind.value] += 1
+            kinds.extend(({"gateway": gateway.name, "kind": kind}, count) for kind, count in counts.items())
+        writer.metric("eltako_devices", "gauge", "Known devices by kind", kinds)
+        writer.histogram("eltako_poll_cycle_seconds", "Duration of a GetStates poll cycle",
+                         [({"gateway": gw.name}, gw.poll_cycle) for gw in gateways])
+        writer.metric("eltako_poll_phase_seconds_total", "counter", "Time spent per poll cycle phase",
+                      [({"gateway": gw.name, "phase": phase}, seconds)
+                       for gw in gateways for phase, seconds in gw.poll_phases.items()])
+        writer.metric("eltako_slow_poll_cycles_total", "counter", "Poll cycles above profiling.slow_cycle",
+                      [({"gateway": gw.name}, gw.slow_cycles) for gw in gateways])
+        writer.metric("eltako_poll_interval_seconds", "gauge", "Current polling interval",
+                      [({"gateway": gw.name}, gw.poll_scheduler.interval) for gw in gateways])
+        writer.histogram("eltako_gateway_request_seconds", "Gateway latency until response headers",
+                         [({"gateway": gw.name, "function": fnc}, h)
+                          for gw in gateways for fnc, h in gw.gateway_latency.items()])
+        writer.metric("eltako_gateway_errors_total", "counter", "Failed gateway requests",
+                      [({"gateway": gw.name, "function": fnc}, count)
+                       for gw in gateways for fnc, count in gw.gateway_errors.items()])
+        writer.metric("eltako_gateway_available", "gauge", "1 unless the gateway circuit breaker is open",
+                      [({"gateway": gw.name}, int(gw.breaker.available)) for gw in gateways])
+        writer.metric("eltako_gateway_breaker_opened_total", "counter", "Times the gateway circuit breaker opened",
+                      [({"gateway": gw.name}, gw.breaker.opened) for gw in gateways])
+        writer.metric("eltako_gateway_connections_total", "counter", "Gateway connections by pool outcome",
+                      [({"gateway": gw.name, "state": state}, count) for gw in gateways
+                       for state, count in (("new", gw.pool_stats.new_connections),
+                                            ("reused", gw.pool_stats.reused_connections))])
+        writer.histogram("eltako_gateway_connect_seconds", "Time to open a gateway connection",
+                         [({"gateway": gw.name}, gw.pool_stats.connect_latency) for gw in gateways])
+        writer.metric("eltako_mqtt_publishes_total", "counter", "MQTT messages published",
+                      [({}, self.mqtt_publishes)])
+        writer.metric("eltako_state_publishes_total", "counter", "State topics by publish cache outcome",
+                      [({"result": "sent"}, self.publish_cache.sent),
+                       ({"result": "suppressed"}, self.publish_cache.suppressed)])
+        offline = self.offline_buffer
+        writer.metric("eltako_offline_buffer_messages", "gauge", "Messages buffered while MQTT is disconnected",
+                      [({}, len(offline))])
+        writer.metric("eltako_offline_buffer_bytes", "gauge", "Size of the offline buffer",
+                      [({}, offline.bytes)])
+        writer.metric("eltako_offline_messages_total", "counter", "Offline buffer messages by outcome",
+                      [({"result": "coalesced"}, offline.coalesced), ({"result": "dropped"}, offline.dropped),
+                       ({"result": "replayed"}, offline.replayed)])
+        if self.telemetry_filter is not None:
+            telemetry = self.telemetry_filter
+            writer.metric("eltako_telemetry_readings_total", "counter", "Filtered sensor readings by outcome",
+                          [({"result": "published"}, telemetry.passed),
+                           ({"result": "deadband"}, telemetry.deadband_suppressed),
+                           ({"result": "held"}, telemetry.interval_held)])
+        writer.metric("eltako_startup_seconds", "gauge", "Seconds from start until each startup phase",
+                      [({"phase": phase}, round(seconds, 6)) for phase, seconds in self.startup.items()])
+        if self.history is not None:
+            writer.metric("eltako_history_series", "gauge", "History series (device fields)",
+                          [({}, self.history.series)])
+            writer.metric("eltako_history_bytes", "gauge", "Memory of the history series",
+                          [({}, self.history.bytes)])
+        writer.metric("eltako_discovery_runs_total", "counter", "Discovery publish runs",
+                      [({}, self.discovery_runs)])
+        writer.metric("eltako_command_queue_depth", "gauge", "Commands waiting to be sent",
+                      [({"gateway": gw.name}, gw.command_queue.depth) for gw in gateways])
+        writer.metric("eltako_commands_total", "counter", "Commands by queue outcome",
+                      [({"gateway": gw.name, "result": result}, count) for gw in gateways
+                       for result, count in (("sent", gw.command_queue.sent),
+                                             ("superseded", gw.command_queue.superseded),
+                                             ("retried", gw.command_retries),
+                                             ("expired", gw.commands_expired))])
+        writer.histogram("eltako_command_queue_wait_seconds", "Time commands waited in the queue",
+                         [({"gateway": gw.name}, gw.command_queue.wait_histogram) for gw in gateways])
+        writer.metric("eltako_command_feedback_total", "counter", "Sent commands by hardware feedback",
+                      [({"gateway": gw.name, "result": result}, count) for gw in gateways
+                       for result, count in (("confirmed", gw.command_tracker.confirmed),
+                                             ("timed_out", gw.command_tracker.timed_out))])
+        writer.histogram("eltako_command_confirm_seconds", "Time until a poll confirmed a command",
+                         [({"gateway": gw.name, "device_type": device_type}, h)
+                          for gw in gateways for device_type, h in gw.command_tracker.latency.items()])
+        writer.histogram("eltako_group_command_seconds", "Time from a group command to its merged state publish",
+                         [({}, self.group_latency)])
+        writer.histogram("eltako_event_loop_lag_seconds", "Event loop scheduling delay",
+                         [({}, self.loop_lag)])
+        writer.metric("eltako_event_loop_lag_last_seconds", "gauge", "Last measured event loop delay",
+                      [({}, round(self.loop_lag_last, 6))])
+        return writer.render()
+
+    async def monitor_loop_lag(self, interval: float = 1.0):
+        """Measure how late the event loop wakes up a sleeping task"""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag_last = max(0.0, time.monotonic() - start - interval)
+            self.loop_lag.observe(self.loop_lag_last)
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.render_metrics().encode(),
+                            headers={"Content-Type": MetricsWriter.CONTENT_TYPE})
+
+    async def _handle_history(self, request: web.Request) -> web.Response:
+        status, result = self.query_history(dict(request.query))
+        return web.json_response(result, status=status)
+
+    def query_history(self, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Answer a history query (sid, gateway, field, window, percentiles, points)
+
+        Returns an HTTP style status and the result or {"error": ...}.
+        """
+        sid = str(params.get('sid') or '')
+        if not sid:
+            return 400, {"error": "sid is required"}
+        name = params.get('gateway')
+        if name is not None:
+            name = str(name)
+        elif not self.namespaced:
+            name = next(iter(self.gateways))
+        if name not in self.gateways:
+            return 400, {"error": "gateway is required" if name is None else f"unknown gateway {name}"}
         try:
-            level = int(float(level))
-        except (ValueError, TypeError):
-            level = 0
-        
-        # Clamp und konvertiere
-        level = max(0, min(level, 100))
-        return round(level * 255 / 100)
+            window = float(params.get('window', 3600))
+            percentiles = params.get('percentiles', (50, 95))
+            if isinstance(percentiles, str):
+                percentiles = [p for p in percentiles.split(',') if p]
+            percentiles = tuple(float(p) for p in percentiles)
+        except (TypeError, ValueError):
+            return 400, {"error": "window and percentiles must be numbers"}
+        if window <= 0 or any(not 0 <= p <= 100 for p in percentiles):
+            return 400, {"error": "window must be positive, percentiles between 0 and 100"}
+        points = str(params.get('points', '')).lower() in ('1', 'true')
+        result = self.history.query(name, sid, params.get('field'), window, percentiles, points)
+        if result is None:
+            return 404, {"error": f"no history for {sid}" + (f" field {params['field']}" if params.get('field') else "")}
+        return 200, result
 
-    def _is_recently_commanded(self, sid: str) -> bool:
-        """Check if device was recently commanded"""
-        if not self._recently_commanded_device or self._recently_commanded_device != sid:
-            return False
-        
-        # Check if command was within timeout window
-        last_time = self._last_dim_command_time.get(sid, 0)
-        if last_time and (time.monotonic() - last_time) < self._command_timeout:
-            return True
-        
-        # Clear if timeout exceeded
-        self._recently_commanded_device = None
-        return False
+    def handle_history_request(self, payload: str):
+        """Answer an MQTT history query on eltako/bridge/history (runs on the event loop)"""
+        try:
+            params = json.loads(payload) if payload.strip().startswith('{') else {"sid": payload.strip()}
+        except ValueError:
+            params = {}
+        if not isinstance(params, dict):
+            params = {}
+        status, result = self.query_history(params) if params else (400, {"error": "invalid request"})
+        if params.get('id') is not None:
+            result["id"] = params['id']
+        result["status"] = status
+        self._mqtt_publish(HISTORY_RESPONSE_TOPIC, json.dumps(result, separators=(',', ':')), retain=False)
 
-    def _log_device_feedback(self, sid: str, device: Dict[str, Any]):
-        """Log device state feedback for debugging (only if MQTT is connected and device was recently commanded)"""
-        if not self.mqtt_connected:
+    async def start_metrics_server(self):
+        """Serve /metrics on the add-on port (8099)"""
+        if not self.metrics_config.get('enabled', True):
             return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        if self.history is not None:
+            app.router.add_get('/history', self._handle_history)
+        self._metrics_runner = web.AppRunner(app, access_log=None)
+        await self._metrics_runner.setup()
+        host = self.metrics_config.get('host', '0.0.0.0')
+        port = self.metrics_config.get('port', 8099)
+        try:
+            await web.TCPSite(self._metrics_runner, host, port).start()
+            logger.info(f"Metrics available on http://{host}:{port}/metrics")
+        except OSError as e:
+            logger.error(f"Metrics server failed to start on port {port}: {e}")
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+
+    async def publish_device_state(self, sid: str, device: DeviceRecord, changed: Optional[Tuple[str, ...]] = None,
+                                   drain: bool = True):
+        """Publish the state topics of a device
         
-        # Only log if device was recently commanded
-        if not self._is_recently_commanded(sid):
+        `changed` lists the fields changed by the last poll; if it is empty
+        the device is skipped (None publishes all topics). Without `drain`
+        the caller waits for the MQTT backpressure itself.
+        """
+        if changed is not None and not changed:
             return
+        base = device.topic
+        values = [("rssi", device.state.rssiPercentage)] + device.handler.state_values(device)
+        if self.json_state:
+            telemetry = self.telemetry_filter
+            if telemetry is not None:
+                values = [(key, telemetry.apply(f"{base}/{key}", key, value)) for key, value in values]
+            self._publish_json_state(base, dict(values))
+        else:
+            for subtopic, value in values:
+                self._publish_state(f"{base}/{subtopic}", value, subtopic)
+        if drain:
+            await self.mqtt_drain()
+
+    def request_discovery(self, devices: Optional[List[Tuple[EltakoGateway, DeviceRecord]]] = None):
+        """Schedule a discovery publish (of all devices or the given ones)
+
+        Requests within the debounce window are merged into one run.
+        """
+        if devices is None:
+            self._discovery_all = True
+        else:
+            for gateway, device in devices:
+                self._discovery_queued[(gateway.name, device.sid)] = (gateway, device)
+        if self._discovery_pending:
+            self.discovery_merged += 1
+            logger.debug("Discovery publish already scheduled, merging request")
+            return
+        self._discovery_pending = True
+        self._spawn(self._debounced_discovery(), "discovery")
+
+    async def _debounced_discovery(self):
+        await asyncio.sleep(self._discovery_debounce)
+        self._discovery_pending = False
+        devices = None if self._discovery_all else list(self._discovery_queued.values())
+        self._discovery_all = False
+        self._discovery_queued.clear()
+        try:
+            await self.publish_discovery(devices)
+        except Exception as e:
+            logger.error(f"Error publishing discovery: {e}")
+
+    def _discovery_payloads(self, gateway: EltakoGateway,
+                            device: DeviceRecord) -> Tuple[List[Tuple[str, str]], List[str], str]:
+        """Serialized discovery configs of a device, cached until its type changes
         
-        device_type = device.get("data", "")
-        state = device.get("state", {})
-        
-        if "blind" in device_type.lower() or "tf_blind" in device_type.lower():
-            pos = state.get("pos", 0)
-            logger.debug(f"Hardware feedback for blind {sid}: position={pos}%")
-        elif self.is_switch_device(device_type):
-            st = state.get("state", "off")
-            logger.debug(f"Hardware feedback for switch {sid}: state={st}")
-        elif "dimmer" in device_type.lower():
-            st = state.get("state", "off")
-            level = state.get("level", 0)
-            logger.debug(f"Hardware feedback for dimmer {sid}: state={st}, level={level}%")
-        elif "weather" in device_type.lower():
-            temp = state.get("temperature", 0)
-            rain = state.get("rain_state", False)
-            wind = state.get("wind", 0)
-            logger.debug(f"Hardware feedback for weather {sid}: temp={temp}°C, rain={rain}, wind={wind}m/s")
-
-    async def publish_device_state(self, sid: str, device: Dict[str, Any]):
-        device_type = device.get("data", "")
-        state = device.get("state", {})
-        base = f"eltako/{sid}"
-        rssi = state.get("rssiPercentage", 0)
-        self.mqtt_client.publish(f"{base}/rssi", rssi, retain=True)
-
-        if "blind" in device_type.lower() or "tf_blind" in device_type.lower():
-            pos = state.get("pos", 0)
-            self.mqtt_client.publish(f"{base}/state", pos, retain=True)
-            sync = state.get("sync", False)
-            self.mqtt_client.publish(f"{base}/sync", sync, retain=True)
-            rv = state.get("rv", 0)
-            rt = state.get("rt", 0)
-            self.mqtt_client.publish(f"{base}/rv", rv, retain=True)
-            self.mqtt_client.publish(f"{base}/rt", rt, retain=True)
-        elif self.is_switch_device(device_type):
-            st = state.get("state", "off")
-            self.mqtt_client.publish(f"{base}/state", st, retain=True)
-        elif "dimmer" in device_type.lower():
-            st = state.get("state", "off")
-            level = state.get("level", 0)
-            brightness = self.eltako_level_to_mqtt_brightness(level)
-            self.mqtt_client.publish(f"{base}/state", st, retain=True)
-            self.mqtt_client.publish(f"{base}/brightness", brightness, retain=True)
-        elif "weather" in device_type.lower():
-            vals = {
-                "wind": state.get("wind", 0),
-                "rain": str(state.get("rain_state", False)).lower(),
-                "temperature": state.get("temperature", 0),
-                "illumination": state.get("illumination", 0),
-                "illumination_east": state.get("s1", 0),
-                "illumination_south": state.get("s2", 0),
-                "illumination_west": state.get("s3", 0),
-            }
-            for k, v in vals.items():
-                # S1/S2/S3: erst mit 1000 multiplizieren, dann runden
-                if k in ("illumination_east", "illumination_south", "illumination_west"):
-                    try:
-                        v = float(v) * 1000
-                        v = int(round(v))
-                    except Exception:
-                        v = 0
-                # zentrale Illumination: nur runden auf int
-                elif k == "illumination":
-                    try:
-                        v = int(round(float(v)))
-                    except Exception:
-                        v = 0
-                self.mqtt_client.publish(f"{base}/{k}", v, retain=True)
-        elif "tf_smoke" in device_type.lower():
-            smoke = state.get("smoke", False)
-            temp = state.get("temperature", 0)
-            self.mqtt_client.publish(f"{base}/smoke", str(smoke).lower(), retain=True)
-            self.mqtt_client.publish(f"{base}/temperature", temp, retain=True)
-
-    async def publish_discovery(self):
-        logger.info("Publishing MQTT discovery")
-        self.discovery_count = 0
-        self.loop = asyncio.get_running_loop()
-        
-        for sid, device in self.devices.items():
-            logger.debug(f"Publishing device with sid [{sid}] and device [{device}]")
-            device_type = device.get("data", "")
-            device_info = {
-                "identifiers": [f"eltako_{sid}"],
-                "name": f"Eltako {sid}",
-                "model": device_type,
-                "manufacturer": "Eltako",
-                "via_device": "eltako_minisafe2"
-            }
-            
-            if "blind" in device_type.lower() or "tf_blind" in device_type.lower():
-                config = {
-                    "name": f"Eltako Blind {sid}",
-                    "unique_id": f"eltako_blind_{sid}",
-                    "device_class": "blind",
-                    "command_topic": f"eltako/{sid}/set",
-                    "position_topic": f"eltako/{sid}/state",
-                    "set_position_topic": f"eltako/{sid}/set",
-                    "set_position_template": "{{ position }}",
-                    "position_closed": 100,
-                    "position_open": 0,
-                    "payload_open": "open",
-                    "payload_close": "close",
-                    "payload_stop": "stop",
-                    "device": device_info
-                }
-                topic = f"homeassistant/cover/eltako_blind_{sid}/config"
-                self.mqtt_client.publish(topic, json.dumps(config), retain=True)
-                self.discovery_count += 1
-                logger.debug(f"Published discovery for blind: {topic}")
-            elif self.is_switch_device(device_type):
-                config = {
-                    "name": f"Eltako Switch {sid}",
-                    "unique_id": f"eltako_switch_{sid}",
-                    "command_topic": f"eltako/{sid}/set",
-                    "state_topic": f"eltako/{sid}/state",
-                    "payload_on": "on",
-                    "payload_off": "off",
-                    "device": device_info
-                }
-                topic = f"homeassistant/switch/eltako_switch_{sid}/config"
-                self.mqtt_client.publish(topic, json.dumps(config), retain=True)
-                self.discovery_count += 1
-                logger.debug(f"Published discovery for switch: {topic}")
-            elif "dimmer" in device_type.lower():
-                config = {
-                    "name": f"Eltako Dimmer {sid}",
-                    "unique_id": f"eltako_dimmer_{sid}",
-                    "command_topic": f"eltako/{sid}/set",
-                    "state_topic": f"eltako/{sid}/state",
-                    "brightness_command_topic": f"eltako/{sid}/set",
-                    "brightness_state_topic": f"eltako/{sid}/brightness",
-                    "brightness_scale": 255,
-                    "payload_on": "on",
-                    "payload_off": "off",
-                    "device": device_info
-                }
-                topic = f"homeassistant/light/eltako_dimmer_{sid}/config"
-                self.mqtt_client.publish(topic, json.dumps(config), retain=True)
-                self.discovery_count += 1
-                logger.debug(f"Published discovery for dimmer: {topic}")
-            elif "weather" in device_type.lower():
-                weather_sensors = [
-                    ("wind", "Wind", "m/s", None, "sensor"),
-                    ("rain", "Rain", None, None, "sensor"),
-                    ("temperature", "Temperature", "°C", "temperature", "sensor"),
-                    ("illumination", "Illumination", "lx", "illuminance", "sensor"),
-                    ("illumination_east", "Illumination East", "lx", "illuminance", "sensor"),
-                    ("illumination_south", "Illumination South", "lx", "illuminance", "sensor"),
-                    ("illumination_west", "Illumination West", "lx", "illuminance", "sensor")
-                ]
-                for key, name, unit, devclass, platform in weather_sensors:
-                    config = {
-                        "name": name,
-                        "unique_id": f"eltako_weather_{key}_{sid}",
-                        "state_topic": f"eltako/{sid}/{key}",
-                        "device": device_info
-                    }
-                    if unit:
-                        config["unit_of_measurement"] = unit
-                    if devclass:
-                        config["device_class"] = devclass
-                    if key == "rain":
-                        config["icon"] = "mdi:weather-pouring"
-                    if "wind" in key:
-                        config["icon"] = "mdi:weather-windy"
-                    topic = f"homeassistant/{platform}/eltako_weather_{key}_{sid}/config"
-                    self.mqtt_client.publish(topic, json.dumps(config), retain=True)
-                self.discovery_count += 7  # 7 weather sensors per device
-                logger.debug(f"Published discovery for weather station: {sid}")
-            elif "tf_smoke" in device_type.lower():
-                # Binary Sensor for smoke detection
-                smoke_config = {
-                    "name": f"Smoke Detector {sid}",
-                    "unique_id": f"eltako_smoke_{sid}",
-                    "state_topic": f"eltako/{sid}/smoke",
-                    "device_class": "smoke",
-                    "payload_on": "true",
-                    "payload_off": "false",
-                    "device": device_info
-                }
-                smoke_topic = f"homeassistant/binary_sensor/eltako_smoke_{sid}/config"
-                self.mqtt_client.publish(smoke_topic, json.dumps(smoke_config), retain=True)
-                
-                # Temperature Sensor
-                temp_config = {
-                    "name": f"Temperature {sid}",
-                    "unique_id": f"eltako_smoke_temp_{sid}",
-                    "state_topic": f"eltako/{sid}/temperature",
-                    "device_class": "temperature",
-                    "unit_of_measurement": "°C",
-                    "device": device_info
-                }
-                temp_topic = f"homeassistant/sensor/eltako_smoke_temp_{sid}/config"
-                self.mqtt_client.publish(temp_topic, json.dumps(temp_config), retain=True)
-                
-                self.discovery_count += 2  # smoke + temperature sensor
-                logger.debug(f"Published discovery for smoke detector: {sid}")
-        
-        logger.info(f"Published {self.discovery_count} discovery configurations")
+        Returns the (topic, payload) pairs, the topics of configs the device
+        no longer has (after a type change), which must be removed, and the
+        hash of the payloads.
+        """
+        signature = (device.device_type, device.kind)
+        cached = self._discovery_cache.get(device.uid)
+        if cached is not None and cached[0] == signature:
+            return cached[1], [], cached[2]
+        device_info = {
+            "identifiers": [f"eltako_{device.uid}"],
+            "name": f"Eltako {device.uid}",
+            "model": device.device_type,
+            "manufacturer": "Eltako",
+            "via_device": gateway.via_device
+        }
+        # Entities are unavailable while the bridge or the gateway is down
+        availability = {
+            "availability": [{"topic": BRIDGE_AVAILABILITY_TOPIC}, {"topic": gateway.availability_topic}],
+            "availability_mode": "all",
+        }
+        configs = device.handler.discovery_configs(device, device_info)
+        if self.json_state:
+            configs = json_state_configs(configs, device.topic)
+        payloads = [(topic, json.dumps({**config, **availability})) for topic, config in configs]
+        stale = []
+        if cached is not None:
+            topics = {topic for topic, _ in payloads}
+            stale = [topic for topic, _ in cached[1] if topic not in topics]
+        digest = hashlib.sha1(json.dumps(payloads).encode()).hexdigest()
+        self._discovery_cache[device.uid] = (signature, payloads, digest)
+        return payloads, stale, digest
+
+    async def publish_discovery(self, devices: Optional[List[Tuple[EltakoGateway, DeviceRecord]]] = None,
+                                changed_only: bool = False):
+        """Publish discovery configs (of all devices or the given ones) in paced batches
+
+        With changed_only, devices whose configs match the hash restored from
+        the snapshot are skipped (their retained configs are still current).
+        """
+        async with self._discovery_lock:
+            if devices is None:
+                logger.info("Publishing MQTT discovery")
+            self.discovery_count = 0
+            self.discovery_runs += 1
+            self.loop = asyncio.get_running_loop()
+            batch = 0
+
+            if devices is None:
+                devices = [(gateway, device) for gateway in self.gateways.values() for device in gateway.devices.values()]
+            for gateway, device in devices:
+                sid = device.sid
+                logger.debug("Publishing device with sid [%s] and device [%s]", sid, device,
+                             extra=log_extra(sid, "discovery", gateway.name, device.kind.value))
+                payloads, stale, digest = self._discovery_payloads(gateway, device)
+                if changed_only and not stale and self._discovery_hashes.get(device.uid) == digest:
+                    continue
+                self._discovery_hashes[device.uid] = digest
+                # Empty retained payload removes configs of a changed device type
+                for topic, payload in [(topic, "") for topic in stale] + payloads:
+                    self._mqtt_publish(topic, payload)
+                    batch += 1
+                    if batch >= self._discovery_batch_size:
+                        batch = 0
+                        await self.mqtt_drain()
+                        await asyncio.sleep(self._discovery_batch_interval)
+                if payloads:
+                    self.discovery_count += len(payloads)
+                    logger.debug("Published discovery for %s %s: %d config(s)", device.kind.value, sid, len(payloads),
+                                 extra=log_extra(sid, "discovery", gateway.name, device.kind.value))
 
-    async def poll_devices(self):
+            self._discovery_published = True
+            logger.info(f"Published {self.discovery_count} discovery configurations")
+
+    async def poll_devices(self, gateway: EltakoGateway):
+        """Polling loop of one gateway; a slow gateway only delays its own loop"""
         while self.running:
+            start = time.monotonic()
+            gateway._fetch_latency = None
             try:
-                devices = await self.fetch_device_states()
-                if devices:
-                    for device in devices:
-                        sid = device.get("sid")
-                        if sid:
-                            self.devices[sid] = device
-                            await self.publish_device_state(sid, device)
-                            # Log hardware feedback in debug mode (only if MQTT connected and recently commanded)
-                            self._log_device_feedback(sid, device)
-                await asyncio.sleep(self.poll_interval)
+                await self._poll_once(gateway)
             except Exception as e:
-                logger.error(f"Polling error: {e}")
-                await asyncio.sleep(self.poll_interval)
+                logger.error(f"Polling error ({gateway.name}): {e}")
+            gateway.poll_cycle.observe(time.monotonic() - start)
+            # Gateway latency: time until the response headers arrived
+            latency = gateway._fetch_latency if gateway._fetch_latency is not None else time.monotonic() - start
+            gateway.poll_scheduler.record_poll(latency)
+            # While the circuit breaker is open, wait for its probe instead
+            retry_after = gateway.breaker.retry_after()
+            if retry_after:
+                await asyncio.sleep(retry_after)
+            else:
+                await gateway.poll_scheduler.wait()
 
-    async def fetch_device_states(self) -> Optional[Dict[str, Any]]:
-        url = f"{self.base_url}?XC_FNC=GetStates&XC_PASS={quote_plus(self.password)}"
+    async def _poll_once(self, gateway: EltakoGateway):
+        """Fetch GetStates and feed each record into the update pipeline as it arrives"""
+        changed = False
+        tracker = gateway.command_tracker
+        # Periodically (heartbeat, reconnect) publish unchanged devices too
+        full_publish = self.publish_cache.full_publish_due(gateway.name)
+        fingerprints = gateway.fingerprints if gateway.delta else None
+        skipped = 0
+        records_seen = 0
+        # Phases: fetch (HTTP incl. skipped records), parse, process, publish
+        # and mqtt_wait (publish backpressure)
+        timer = PhaseTimer()
+        parse_time = gateway.parse_stats.total_parse_time
+        drain_time = self.mqtt_transport.drain_time if self.mqtt_transport else 0.0
         try:
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    if text.startswith("{XC_SUC}"):
-                        json_data = text[8:]
-                        return json.loads(json_data)
-                    logger.error(f"Unexpected response: {text}")
-                else:
-                    logger.error(f"HTTP error {response.status}")
-        except Exception as e:
-            logger.error(f"Error fetching device states: {e}")
-        return None
+            async with aclosing(gateway.iter_device_states()) as records:
+                async for raw in records:
+                    records_seen += 1
+                    sid = raw.get("sid")
+                    if not sid:
+                        continue
+                    if fingerprints is not None:
+                        fingerprint = record_fingerprint(raw)
+                        # Unchanged record: nothing to update, publish or confirm
+                        if not full_publish and fingerprints.get(sid) == fingerprint and not tracker.is_tracked(sid):
+                            skipped += 1
+                            continue
+                    timer.lap("fetch")
+                    gateway.records_processed += 1
+                    # Don't let a stale poll overwrite an optimistic state
+                    if not tracker.accept_poll(sid, raw.get("state") or {}):
+                        logger.debug("Ignoring stale state for %s while command is in flight", sid,
+                                     extra=log_extra(sid, "poll", gateway.name))
+                        continue
+                    if fingerprints is not None:
+                        fingerprints[sid] = fingerprint
+                    device, fields = gateway.update_device(sid, raw)
+                    if self.history is not None and (fields is None or fields):
+                        self.history.record(gateway.name, device, fields)
+                    timer.lap("process")
+                    if fields is None and self._discovery_published:
+                        # New device or changed device type: published with the
+                        # next debounced discovery run, outside of this poll
+                        self.request_discovery([(gateway, device)])
+                    # RSSI jitters constantly, it doesn't count as activity
+                    if fields and (len(fields) > 1 or fields[0] != "rssiPercentage"):
+                        changed = True
+                    await self.publish_device_state(sid, device, None if full_publish else fields)
+                    # Log hardware feedback in debug mode (only if MQTT connected and recently commanded)
+                    self._log_device_feedback(gateway, sid, device)
+                    timer.lap("publish")
+            timer.lap("fetch")
+        finally:
+            timer.move("fetch", "parse", gateway.parse_stats.total_parse_time - parse_time)
+            if self.mqtt_transport:
+                timer.move("publish", "mqtt_wait", self.mqtt_transport.drain_time - drain_time)
+            gateway.record_poll_phases(timer, records_seen, skipped)
+        gateway.records_skipped += skipped
+        if self.telemetry_filter is not None:
+            # Readings held back by min_interval, also for devices that didn't change
+            released: Dict[str, Dict[str, Any]] = {}
+            for topic, value in self.telemetry_filter.due():
+                if not self.json_state:
+                    self._publish_state(topic, value)
+                    continue
+                base, key = topic.rsplit('/', 1)
+                document = self._json_states.get(base)
+                if document is not None:
+                    released[base] = {**released.get(base, document), key: value}
+            for base, document in released.items():
+                self._publish_json_state(base, document)
+        if changed:
+            gateway.poll_scheduler.notify_activity()
+        tracker.expire()
+        self._maybe_log_statistics()
 
     async def run(self):
         logger.info("Starting Eltako2MQTT Bridge (paho-mqtt 2.1.0 - CallbackAPIVersion.VERSION2)")
         self.loop = asyncio.get_event_loop()
-        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        gateways = list(self.gateways.values())
+        for gateway in gateways:
+            gateway.session = gateway.create_session()
+        self._started = time.monotonic()
+        lag_monitor = asyncio.create_task(self.monitor_loop_lag())
+        snapshot_task: Optional[asyncio.Task] = None
+        capture_task: Optional[asyncio.Task] = None
+        mqtt_task: Optional[asyncio.Task] = None
         try:
-            await self.setup_mqtt()
-            devices = await self.fetch_device_states()
-            if not devices:
-                logger.error("No devices found")
-                return
-            for device in devices:
-                sid = device.get("sid")
-                if sid:
-                    self.devices[sid] = device
-                    logger.info(f"Found device {sid}: {device.get('data')}")
-            await self.publish_discovery()
-            for sid, device in self.devices.items():
-                await self.publish_device_state(sid, device)
+            await self.start_metrics_server()
+            if self.capture:
+                capture_task = asyncio.create_task(self._capture_loop())
+            restored = self._restore_snapshot()
+            # The broker connect and the initial GetStates run concurrently;
+            # commands received before the inventory is loaded wait in the queues
+            mqtt_task = asyncio.create_task(self._connect_mqtt())
+            if restored:
+                # Warm start: the inventory comes from the snapshot
+                self._startup_phase("inventory")
+            else:
+                # Gateways are read concurrently; one that is down is retried by its poll loop
+                loaded = await asyncio.gather(*(self._load_gateway(gateway) for gateway in gateways))
+                if not any(loaded):
+                    logger.error("No devices found")
+                    return
+                self._startup_phase("inventory")
+            await mqtt_task
             self.running = True
-            await self.poll_devices()
+            for gateway in gateways:
+                gateway.command_queue.start()
+            self._startup_phase("ready")
+            self._publish_availability()
+            logger.info(f"Bridge ready after {self.startup['ready']:.2f}s "
+                        f"({'warm' if restored else 'cold'} start, MQTT after {self.startup['mqtt']:.2f}s)")
+            if restored:
+                # The first live poll publishes only what differs from the snapshot
+                await self.publish_discovery(changed_only=True)
+            else:
+                await self.publish_discovery()
+                for gateway in gateways:
+                    for sid, device in gateway.devices.items():
+                        await self.publish_device_state(sid, device)
+            if self.snapshot and self._snapshot_interval:
+                snapshot_task = asyncio.create_task(self._snapshot_loop())
+            await asyncio.gather(*(self.poll_devices(gateway) for gateway in gateways))
         except Exception as e:
             logger.error(f"Runtime error: {e}")
         finally:
-            if self.mqtt_client:
+            lag_monitor.cancel()
+            if snapshot_task:
+                snapshot_task.cancel()
+            if capture_task:
+                capture_task.cancel()
+            if mqtt_task and not mqtt_task.done():
+                mqtt_task.cancel()
+                await asyncio.gather(mqtt_task, return_exceptions=True)
+            for gateway in gateways:
+                await gateway.command_queue.stop()
+            for task in list(self._background_tasks):
+                task.cancel()
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+            if self.snapshot and self.iter_devices():
+                await self._save_snapshot()
+            if self.capture:
+                await self._write_capture()
+            if self._metrics_runner:
+                await self._metrics_runner.cleanup()
+            logger.info(f"Statistics: {json.dumps(self.get_statistics())}")
+            if self.mqtt_connected:
+                # A clean disconnect doesn't trigger the last will
+                self._mqtt_publish(BRIDGE_AVAILABILITY_TOPIC, "offline")
+            if self.mqtt_transport:
+                await self.mqtt_transport.stop()
+            elif self.mqtt_client:
                 self.mqtt_client.loop_stop()
                 self.mqtt_client.disconnect()
-            if self.session:
-                await self.session.close()
+            for gateway in gateways:
+                if gateway.session:
+                    await gateway.session.close()
             logger.info("Bridge stopped")
 
+    async def _connect_mqtt(self):
+        await self.setup_mqtt()
+        # connect() returns before the CONNACK; publishing earlier only fills the offline buffer
+        while not self._mqtt_ready.is_set():
+            try:
+                await asyncio.wait_for(self._mqtt_ready.wait(), 30)
+            except asyncio.TimeoutError:
+                logger.warning("Still waiting for the MQTT broker to accept the connection")
+        self._startup_phase("mqtt")
+
+    def _startup_phase(self, phase: str):
+        self.startup[phase] = time.monotonic() - self._started
+
+    async def _load_gateway(self, gateway: EltakoGateway) -> bool:
+        """Initial GetStates of a gateway, False if it returned no devices"""
+        devices = await gateway.fetch_device_states()
+        if not devices:
+            if self.namespaced:
+                logger.error(f"No devices found on gateway {gateway.name} ({gateway.host})")
+            return False
+        for raw in devices:
+            sid = raw.get("sid")
+            if sid:
+                device, _ = gateway.update_device(sid, raw)
+                if self.history is not None:
+                    self.history.record(gateway.name, device, None)
+                logger.info("Found device %s: %s (%s)", device.uid, device.device_type, device.kind.value,
+                            extra=log_extra(sid, "startup", gateway.name, device.kind.value))
+        return True
+
+    def _snapshot_data(self) -> Dict[str, Any]:
+        """Inventory, states, discovery hashes and published state payloads"""
+        return {
+            "gateways": {
+                name: {
+                    "host": gateway.host,
+                    "devices": [
+                        {"sid": device.sid, "data": device.device_type, "adr": device.address,
+                         "state": device.state.as_dict()}
+                        for device in gateway.devices.values()
+                    ],
+                }
+                for name, gateway in self.gateways.items()
+            },
+            "discovery": dict(self._discovery_hashes),
+            "published": {topic: payload for topic, payload in self.publish_cache.payloads().items()
+                          if isinstance(payload, str) and not topic.startswith("homeassistant/")},
+        }
+
+    def _restore_snapshot(self) -> int:
+        """Rebuild devices and caches from the snapshot, returns the device count"""
+        data = self.snapshot.load() if self.snapshot else None
+        if not data:
+            return 0
+        restored = 0
+        for name, saved in (data.get("gateways") or {}).items():
+            gateway = self.gateways.get(name)
+            # A renamed or moved gateway starts cold
+            if gateway is None or saved.get("host") != gateway.host:
+                continue
+            for raw in saved.get("devices") or []:
+                sid = raw.get("sid")
+                if sid:
+                    gateway.update_device(sid, raw)
+                    restored += 1
+        if restored:
+            self._discovery_hashes.update(data.get("discovery") or {})
+            for topic, payload in (data.get("published") or {}).items():
+                self.publish_cache.remember(topic, payload)
+            self._keep_publish_cache = True
+            logger.info(f"Warm start: restored {restored} devices from {self.snapshot.path} "
+                        f"(saved {self.snapshot.loaded_age:.0f}s ago)")
+        return restored
+
+    async def _save_snapshot(self):
+        # Serialized on the loop (consistent view), written in an executor
+        data = self._snapshot_data()
+        try:
+            await self.loop.run_in_executor(None, self.snapshot.save, data)
+        except OSError as e:
+            logger.warning(f"Failed to save snapshot {self.snapshot.path}: {e}")
+
+    async def _snapshot_loop(self):
+        while self.running:
+            await asyncio.sleep(self._snapshot_interval)
+            await self._save_snapshot()
+
+    async def _write_capture(self):
+        lines = self.capture.take()
+        if not lines:
+            return
+        try:
+            await self.loop.run_in_executor(None, self.capture.write, lines)
+        except OSError as e:
+            logger.warning(f"Failed to write capture {self.capture.path}: {e}")
+
+    async def _capture_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            await self._write_capture()
+
+
 async def main():
     if len(sys.argv) != 2:
         print("Usage: python3 eltako2mqtt.py <config_file>")
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+
+"""
+Eltako2MQTT Capture Replay
+
+Feeds a traffic capture (`capture.enabled`) back through the bridge, with
+no gateway or broker: GetStates requests are answered with the captured
+response that was current at that point of the capture, SendSC requests
+with the captured result for the device, and the captured MQTT commands
+are injected at their original offsets. Reports poll and command
+throughput and latency, so an incident becomes a repeatable test.
+
+Usage: python3 replay.py /data/eltako2mqtt_capture.jsonl [--speed 10] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+import eltako2mqtt
+from benchmark import percentile, rss_mb
+
+
+def load_capture(path: str, session: int = -1) -> List[Dict[str, Any]]:
+    """Records of one bridge run (the `start` record and everything after it)"""
+    runs: List[List[Dict[str, Any]]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of a capture cut off by a crash
+                continue
+            if record.get("type") == "start" or not runs:
+                runs.append([])
+            runs[-1].append(record)
+    if not runs:
+        raise ValueError(f"{path} contains no records")
+    return runs[session]
+
+
+class ReplayClock:
+    """Capture time, running `speed` times faster than real time"""
+
+    def __init__(self, speed: float, offset: float = 0.0):
+        self.speed = speed
+        self.offset = offset
+        self._start = time.monotonic()
+
+    def now(self) -> float:
+        return self.offset + (time.monotonic() - self._start) * self.speed
+
+    async def sleep_until(self, t: float):
+        delay = (t - self.now()) / self.speed
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ReplayResponse:
+    def __init__(self, status: int, body: str):
+        self.status = status
+        self._body = body.encode()
+
+    async def text(self) -> str:
+        return self._body.decode()
+
+    async def read(self) -> bytes:
+        return self._body
+
+    @property
+    def content(self) -> "ReplayResponse":
+        return self
+
+    async def iter_chunked(self, size: int):
+        for start in range(0, len(self._body), size):
+            yield self._body[start:start + size]
+
+
+class ReplayRequest:
+    def __init__(self, respond):
+        self._respond = respond
+
+    async def __aenter__(self) -> ReplayResponse:
+        return await self._respond()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class ReplayGateway:
+    """Stands in for the aiohttp session of one gateway
+
+    GetStates returns the captured response whose request started last
+    before the current capture time, rebuilt from the last keyframe and
+    the changes since; SendSC returns the next captured result for the
+    device ({XC_SUC} if there is none). Captured response times are
+    replayed at the replay speed.
+    """
+
+    def __init__(self, name: str, records: List[Dict[str, Any]], clock: ReplayClock, version: int = 2):
+        self.name = name
+        self.clock = clock
+        self.states: List[Dict[str, Any]] = []
+        self.results: Dict[str, deque] = defaultdict(deque)
+        self.addresses: Dict[str, str] = {}
+        devices: Dict[str, Dict[str, Any]] = {}
+        current: List[Dict[str, Any]] = []
+        for record in records:
+            if record.get("gateway") != name:
+                continue
+            if record["type"] == "sendsc":
+                self.results[record["sid"]].append(record)
+            elif record["type"] == "getstates":
+                if "error" not in record:
+                    # Version 1 captures hold full responses only
+                    if record.get("full", version < 2):
+                        devices.clear()
+                    for sid in record.get("removed") or []:
+                        devices.pop(sid, None)
+                    for device in record.get("records") or []:
+                        devices[device.get("sid")] = device
+                        if device.get("adr") and device.get("sid"):
+                            self.addresses[str(device["adr"])] = device["sid"]
+                    # Unchanged responses share the previous list
+                    if record.get("records") or record.get("removed") or not current:
+                        current = list(devices.values())
+                    record = {**record, "records": current}
+                self.states.append(record)
+        self.sent: List[Tuple[str, float]] = []
+        self.polls = 0
+
+    def get(self, url: Any) -> ReplayRequest:
+        url = str(url)
+        if "XC_FNC=GetStates" in url:
+            return ReplayRequest(self._getstates)
+        address = url.split("&address=", 1)[1].split("&", 1)[0] if "&address=" in url else ""
+        return ReplayRequest(lambda: self._sendsc(self.addresses.get(address, address)))
+
+    def _current_state(self) -> Optional[Dict[str, Any]]:
+        now = self.clock.now()
+        current = self.states[0] if self.states else None
+        for state in self.states:
+            if state["t"] - state.get("elapsed", 0) > now:
+                break
+            current = state
+        return current
+
+    async def _getstates(self) -> ReplayResponse:
+        self.polls += 1
+        state = self._current_state()
+        if state is None:
+            raise aiohttp.ClientError("capture has no GetStates response")
+        await asyncio.sleep(state.get("elapsed", 0) / self.clock.speed)
+        if "error" in state:
+            raise aiohttp.ClientError(state["error"])
+        return ReplayResponse(200, "{XC_SUC}" + json.dumps(state.get("records") or []))
+
+    async def _sendsc(self, sid: str) -> ReplayResponse:
+        self.sent.append((sid, time.monotonic()))
+        results = self.results.get(sid)
+        result = results.popleft() if results else {}
+        await asyncio.sleep(result.get("elapsed", 0) / self.clock.speed)
+        if "error" in result:
+            raise aiohttp.ClientError(result["error"])
+        return ReplayResponse(result.get("status", 200), result.get("response", "{XC_SUC}"))
+
+    async def close(self):
+        pass
+
+
+class ReplayMQTTClient:
+    """Collects what the bridge publishes"""
+
+    def __init__(self):
+        self.publishes = 0
+        self.topics: set = set()
+
+    def publish(self, topic: str, payload: Any = None, retain: bool = False):
+        self.publishes += 1
+        self.topics.add(topic)
+
+    def subscribe(self, topic: str):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class ReplayMessage:
+    def __init__(self, topic: str, payload: str):
+        self.topic = topic
+        self.payload = payload.encode()
+        self.retain = False
+
+
+def write_config(captured: Dict[str, Any], args: argparse.Namespace) -> str:
+    """Bridge config from the settings in the start record, with poll and command timing scaled"""
+    speed = args.speed
+    polling = captured.get("polling") or {}
+    commands = captured.get("commands") or {}
+    config: Dict[str, Any] = {
+        **captured,
+        "eltako": {"host": "replay", "password": "replay", "poll_interval": args.poll_interval / speed},
+        "mqtt": {"host": "replay", "loop": "thread"},
+        "polling": {**polling, "fast_interval": polling.get("fast_interval", 1) / speed,
+                    "fast_window": polling.get("fast_window", 15) / speed},
+        "commands": {**commands, "min_spacing": commands.get("min_spacing", 0.1) / speed},
+        "logging": {"level": "WARNING"},
+        "publish": {**(captured.get("publish") or {}), "stats_interval": 0},
+        "metrics": {"enabled": False},
+        "snapshot": {"enabled": False},
+    }
+    # Same gateway names (and topics) as the captured bridge
+    config["gateways"] = [
+        {**gateway, "host": f"replay-{gateway['name']}",
+         "poll_interval": gateway.get("poll_interval", args.poll_interval) / speed}
+        for gateway in captured["gateways"]
+    ]
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        json.dump(config, f)
+    return f.name
+
+
+async def replay(records: List[Dict[str, Any]], args: argparse.Namespace) -> Dict[str, Any]:
+    start_record = records[0] if records[0]["type"] == "start" else {}
+    # Version 1 captures have no config, only the gateway names
+    captured = dict(start_record.get("config") or {})
+    if not captured.get("gateways"):
+        names = start_record.get("gateways") or sorted({r["gateway"] for r in records if r.get("gateway")}) or ["gw1"]
+        captured["gateways"] = [{"name": name} for name in names]
+    config_path = write_config(captured, args)
+    try:
+        bridge = eltako2mqtt.EltakoMiniSafe2Bridge(config_path)
+    finally:
+        os.unlink(config_path)
+    end = max(r["t"] for r in records)
+    clock = ReplayClock(args.speed)
+    version = start_record.get("version", 1)
+    gateways = {name: ReplayGateway(name, records, clock, version) for name in bridge.gateways}
+    for name, gateway in bridge.gateways.items():
+        gateway.create_session = lambda replayed=gateways[name]: replayed
+    client = ReplayMQTTClient()
+
+    async def setup_mqtt():
+        bridge.mqtt_client = client
+        bridge.on_mqtt_connect(client, None, None, 0, None)
+
+    bridge.setup_mqtt = setup_mqtt
+    cycle_times: List[float] = []
+    poll_once = bridge._poll_once
+
+    async def timed_poll_once(gateway):
+        poll_start = time.perf_counter()
+        try:
+            await poll_once(gateway)
+        finally:
+            cycle_times.append(time.perf_counter() - poll_start)
+
+    bridge._poll_once = timed_poll_once
+    injected: Dict[str, deque] = defaultdict(deque)
+    commands = [r for r in records if r["type"] == "command"]
+    finished: Dict[str, float] = {}
+
+    async def inject():
+        for record in commands:
+            await clock.sleep_until(record["t"])
+            sid = record["topic"].split("/")[-2]
+            injected[sid].append(time.monotonic())
+            bridge.on_mqtt_message(client, None, ReplayMessage(record["topic"], record["payload"]))
+        await clock.sleep_until(end + 1)
+        # Measured until here; the shutdown waits for the current poll tick
+        finished.update(wall=time.monotonic() - wall_start, cpu=time.process_time() - cpu_start)
+        bridge.running = False
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    injector = asyncio.create_task(inject())
+    await bridge.run()
+    injector.cancel()
+    wall = finished.get("wall", time.monotonic() - wall_start)
+    cpu = finished.get("cpu", time.process_time() - cpu_start)
+
+    # Command latency: MQTT message until the SendSC request reached the gateway
+    latencies = []
+    for gateway in gateways.values():
+        for sid, sent_at in sorted(gateway.sent, key=lambda item: item[1]):
+            pending = injected.get(sid)
+            if pending:
+                latencies.append(sent_at - pending.popleft())
+    stats = bridge.get_statistics()
+    records_processed = sum(gw["delta"]["processed"] + gw["delta"]["skipped"] for gw in stats["gateways"].values())
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "capture_s": round(end, 1),
+        "replay_s": round(wall, 2),
+        "speed": args.speed,
+        "polls": sum(gateway.polls for gateway in gateways.values()),
+        "captured_polls": sum(len(gateway.states) for gateway in gateways.values()),
+        "records_per_s": round(records_processed / wall, 1) if wall else None,
+        "poll_cycle_avg_ms": ms(statistics.mean(cycle_times)) if cycle_times else None,
+        "poll_cycle_p95_ms": ms(percentile(cycle_times, 95)),
+        "commands": len(commands),
+        "commands_sent": sum(len(gateway.sent) for gateway in gateways.values()),
+        "command_latency_avg_ms": ms(statistics.mean(latencies)) if latencies else None,
+        "command_latency_p95_ms": ms(percentile(latencies, 95)),
+        "mqtt_publishes": client.publishes,
+        "publishes_per_s": round(client.publishes / wall, 1) if wall else None,
+        "cpu_percent": round(100 * cpu / wall, 1) if wall else None,
+        "rss_mb": round(rss_mb(), 1),
+        "statistics": stats,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay an Eltako2MQTT traffic capture through the bridge")
+    parser.add_argument("capture", help="Capture file written with capture.enabled")
+    parser.add_argument("--speed", type=float, default=1, help="Replay speed, e.g. 10 for 10x (default: 1)")
+    parser.add_argument("--session", type=int, default=-1,
+                        help="Bridge run in the capture to replay, 0 = first, -1 = last (default: -1)")
+    parser.add_argument("--poll-interval", type=float, default=5,
+                        help="poll_interval of the captured bridge in seconds, for captures without "
+                             "its settings (default: 5)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    records = load_capture(args.capture, args.session)
+    result = asyncio.run(replay(records, args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            if key != "statistics":
+                print(f"{key:>24}  {value}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,24 +9,32 @@ CONFIG_PATH=/data/options.json
 ELTAKO_HOST=$(bashio::config 'eltako.host')
 ELTAKO_PASSWORD=$(bashio::config 'eltako.password')
 ELTAKO_POLL_INTERVAL=$(bashio::config 'eltako.poll_interval')
+ELTAKO_RESPONSE_PARSER=$(bashio::config 'eltako.response_parser' 'stream')
 MQTT_HOST=$(bashio::config 'mqtt.host')
 MQTT_PORT=$(bashio::config 'mqtt.port')
 MQTT_USERNAME=$(bashio::config 'mqtt.username')
 MQTT_PASSWORD=$(bashio::config 'mqtt.password')
 MQTT_CLIENT_ID=$(bashio::config 'mqtt.client_id')
+MQTT_LOOP=$(bashio::config 'mqtt.loop' 'thread')
+MQTT_MAX_PENDING=$(bashio::config 'mqtt.max_pending' '1000')
 LOG_LEVEL=$(bashio::config 'logging.level')
+LOG_FORMAT=$(bashio::config 'logging.format' 'text')
+LOG_QUEUE=$(bashio::config 'logging.queue' 'true')
 
 bashio::log.info "Starting Eltako2MQTT Bridge..."
 
 # Validate required configuration
-if bashio::var.is_empty "${ELTAKO_HOST}"; then
-    bashio::log.fatal "Eltako host is required but not configured!"
-    bashio::exit.nok
-fi
+# A gateways list replaces eltako.host/password
+if ! bashio::config.has_value 'gateways'; then
+    if bashio::var.is_empty "${ELTAKO_HOST}"; then
+        bashio::log.fatal "Eltako host is required but not configured!"
+        bashio::exit.nok
+    fi
 
-if bashio::var.is_empty "${ELTAKO_PASSWORD}"; then
-    bashio::log.fatal "Eltako password is required but not configured!"
-    bashio::exit.nok
+    if bashio::var.is_empty "${ELTAKO_PASSWORD}"; then
+        bashio::log.fatal "Eltako password is required but not configured!"
+        bashio::exit.nok
+    fi
 fi
 
 if bashio::var.is_empty "${MQTT_HOST}"; then
@@ -40,16 +48,26 @@ eltako:
   host: "${ELTAKO_HOST}"
   password: "${ELTAKO_PASSWORD}"
   poll_interval: ${ELTAKO_POLL_INTERVAL}
+  response_parser: "${ELTAKO_RESPONSE_PARSER}"
 
 mqtt:
   host: "${MQTT_HOST}"
   port: ${MQTT_PORT}
   client_id: "${MQTT_CLIENT_ID}"
+  loop: "${MQTT_LOOP}"
+  max_pending: ${MQTT_MAX_PENDING}
 
 logging:
   level: "${LOG_LEVEL}"
+  format: "${LOG_FORMAT}"
+  queue: ${LOG_QUEUE}
 EOF
 
+# DEBUG logging for selected devices only
+if bashio::config.has_value 'logging.debug_sids'; then
+    sed -i "/^logging:/a\  debug_sids: $(jq -c '.logging.debug_sids' "${CONFIG_PATH}")" /tmp/eltako2mqtt.yaml
+fi
+
 # Add MQTT credentials if provided
 if ! bashio::var.is_empty "${MQTT_USERNAME}"; then
     sed -i "/^mqtt:/a\  username: \"${MQTT_USERNAME}\"" /tmp/eltako2mqtt.yaml
@@ -59,6 +77,13 @@ if ! bashio::var.is_empty "${MQTT_PASSWORD}"; then
     sed -i "/username:/a\  password: \"${MQTT_PASSWORD}\"" /tmp/eltako2mqtt.yaml
 fi
 
+# Pass optional advanced sections through as-is (JSON is valid YAML)
+for section in gateways groups http polling commands retry discovery publish telemetry metrics profiling snapshot capture history; do
+    if bashio::config.exists "${section}"; then
+        echo "${section}: $(jq -c ".${section}" "${CONFIG_PATH}")" >> /tmp/eltako2mqtt.yaml
+    fi
+done
+
 # Set Python environment
 export PYTHONPATH="/usr/lib/python3.11/site-packages"
 if [[ "${LOG_LEVEL}" == "DEBUG" ]]; then